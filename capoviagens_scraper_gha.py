@@ -19,15 +19,12 @@ jobs:
     strategy:
       fail-fast: false
       matrix:
-        grupo:
-          - { nome: G1, trechos: "CGH-SDU,SDU-CGH,GRU-POA,POA-GRU" }
-          - { nome: G2, trechos: "CGH-GIG,GIG-CGH,BSB-CGH,CGH-BSB" }
-          - { nome: G3, trechos: "CGH-REC,REC-CGH,CGH-SSA,SSA-CGH" }
-          - { nome: G4, trechos: "BSB-GIG,GIG-BSB,GIG-REC,REC-GIG" }
-          - { nome: G5, trechos: "GIG-SSA,SSA-GIG,BSB-SDU,SDU-BSB" }
+        # Todos os jobs recebem a lista completa; cada um faz a fatia i % total == job-index
+        # das combinações (trecho, ADVP), então nenhum trecho fica preso sempre no mesmo job.
+        grupo: [G1, G2, G3, G4, G5]
 
     concurrency:
-      group: capo-xls-${{ matrix.grupo.nome }}
+      group: capo-xls-${{ matrix.grupo }}
       cancel-in-progress: false
 
     steps:
@@ -43,6 +40,7 @@ jobs:
         with:
           python-version: "3.12"
           cache: "pip"
+          cache-dependency-path: requirements-capo.txt
 
       - name: Setup Chrome + Chromedriver
         id: chrome
@@ -55,7 +53,7 @@ jobs:
       - name: Install deps
         run: |
           python -m pip install --upgrade pip
-          pip install "selenium>=4.24.0" "pandas==2.2.2" "openpyxl==3.1.5"
+          pip install -r requirements-capo.txt
 
       - name: Sanity check (versions)
         run: |
@@ -65,16 +63,16 @@ jobs:
           which chromedriver || true
           chromedriver --version
 
-      - name: Run ${{ matrix.grupo.nome }}
+      - name: Run ${{ matrix.grupo }}
         shell: bash
         env:
-          TRECHOS_CSV: ${{ matrix.grupo.trechos }}
+          TRECHOS_CSV: "CGH-SDU,SDU-CGH,GRU-POA,POA-GRU,CGH-GIG,GIG-CGH,BSB-CGH,CGH-BSB,CGH-REC,REC-CGH,CGH-SSA,SSA-CGH,BSB-GIG,GIG-BSB,GIG-REC,REC-GIG,GIG-SSA,SSA-GIG,BSB-SDU,SDU-BSB"
           ADVPS_CSV: "1,5,11,17,30"
           CHROME_PATH: ${{ steps.chrome.outputs.chrome-path }}
           # Não defina CHROMEDRIVER_PATH. Use o PATH resolvido pelo action.
         run: |
           set -e
-          mkdir -p "data/${{ matrix.grupo.nome }}"
+          mkdir -p "data/${{ matrix.grupo }}"
 
           CANDIDATES=("scripts/capoviagens_scraper_gha.py" \
                       "scripts/capo_scraper.py" \
@@ -96,9 +94,11 @@ jobs:
 
           echo "Usando script: $SCRIPT_PATH"
           timeout 22m python -u "$SCRIPT_PATH" \
-            --out-dir "data/${{ matrix.grupo.nome }}" \
+            --out-dir "data/${{ matrix.grupo }}" \
             --trechos "${TRECHOS_CSV}" \
             --advps "${ADVPS_CSV}" \
+            --slice-idx "${{ strategy.job-index }}" \
+            --total-slices "${{ strategy.job-total }}" \
             --timeout 60 \
             --check-no-results 30 \
             --poll 1 \
@@ -121,12 +121,12 @@ jobs:
         shell: bash
         run: |
           set -e
-          git add "data/${{ matrix.grupo.nome }}/" || true
+          git add "data/${{ matrix.grupo }}/" || true
           if git diff --cached --quiet; then
             echo "did_commit=0" >> "$GITHUB_OUTPUT"
             echo "Sem mudanças para commit."
           else
-            git commit -m "CAPO ${{ matrix.grupo.nome }} XLS $(date -u +'%Y-%m-%dT%H:%M:%SZ')"
+            git commit -m "CAPO ${{ matrix.grupo }} XLS $(date -u +'%Y-%m-%dT%H:%M:%SZ')"
             echo "did_commit=1" >> "$GITHUB_OUTPUT"
           fi
 
@@ -4,26 +4,29 @@
 # Execução no GitHub Actions: ver .github/workflows/scrape.yml
 
 import os, re, time, argparse, logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from datetime import datetime, timedelta, date, time as dtime
 from decimal import Decimal, InvalidOperation
-from zoneinfo import ZoneInfo
 from zipfile import ZipFile
 
 from openpyxl import Workbook, load_workbook
 from openpyxl.utils import get_column_letter
-from openpyxl.styles import Alignment
+from openpyxl.styles import Alignment, NamedStyle
 
 # ===== Selenium (robusto p/ CI) =====
-from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import (TimeoutException, NoSuchElementException, StaleElementReferenceException,
+                                        WebDriverException, JavascriptException)
+
+from scraper_common import (TZ, CHROME_FLAGS, CHROME_PREFS, DriverPool, CacheResultados, PASTA_CACHE,
+                            maybe_set_binary_location, new_chrome, navigate_same_tab, wait_new_tab_or_nav,
+                            to_excel_naive)
 
 # ======= CONFIG PADRÃO =======
-TZ = ZoneInfo("America/Sao_Paulo")
 SHEET_NAME = "BUSCAS"
 
 ADVP_LIST = [1, 3, 7, 14, 21, 30, 60, 90]
@@ -41,14 +44,74 @@ TRECHOS = [
 ]
 
 # XPaths (ajuste se o site mudar)
-XPATH_NO_FLIGHTS    = '//*[@id="flights"]/div/h3'
 XPATH_TEXTO_COMPRAR = "//button[normalize-space()='Comprar' or contains(translate(.,'COMPRAR','comprar'),'comprar')]"
-XPATH_BOTAO_COMPRAR = '/html/body/div[1]/main/section/div[2]/div[3]/div[2]/div/div[1]/div[2]/button'
-XPATH_PARTIDA = '//*[@id="app"]/main/section/section/section/section[1]/div[2]/div[1]/p[1]'
-XPATH_CHEGADA = '//*[@id="app"]/main/section/section/section/section[1]/div[2]/div[2]/p[1]'
-XPATH_TARIFA  = '//*[@id="app"]/main/section/section/section/section[2]/section[2]/section[2]/p[2]'
-XPATH_TAXA    = '//*[@id="app"]/main/section/section/section/section[2]/section[2]/section[4]/p[2]'
-XPATH_CIA     = '//*[@id="app"]/main/section/section/section/section[1]/div[3]/div[2]/p[2]'
+# 2ª página: campos relativos ao container do resumo (CSS_RESUMO)
+XPATH_PARTIDA = './section[1]/div[2]/div[1]/p[1]'
+XPATH_CHEGADA = './section[1]/div[2]/div[2]/p[1]'
+XPATH_TARIFA  = './section[2]/section[2]/section[2]/p[2]'
+XPATH_TAXA    = './section[2]/section[2]/section[4]/p[2]'
+XPATH_CIA     = './section[1]/div[3]/div[2]/p[2]'
+
+# Mesmos campos em CSS (querySelector), lidos numa única chamada; os XPaths acima ficam de fallback
+CSS_RESUMO = "#app > main > section > section > section"
+CSS_CAMPOS = {
+    "partida": ":scope > section:nth-of-type(1) > div:nth-of-type(2) > div:nth-of-type(1) > p:nth-of-type(1)",
+    "chegada": ":scope > section:nth-of-type(1) > div:nth-of-type(2) > div:nth-of-type(2) > p:nth-of-type(1)",
+    "tarifa":  ":scope > section:nth-of-type(2) > section:nth-of-type(2) > section:nth-of-type(2) > p:nth-of-type(2)",
+    "taxa":    ":scope > section:nth-of-type(2) > section:nth-of-type(2) > section:nth-of-type(4) > p:nth-of-type(2)",
+    "cia":     ":scope > section:nth-of-type(1) > div:nth-of-type(3) > div:nth-of-type(2) > p:nth-of-type(2)",
+}
+XPATH_CAMPOS = {  # campo -> (xpath relativo, tries, delay)
+    "partida": (XPATH_PARTIDA, 3, 3),
+    "chegada": (XPATH_CHEGADA, 3, 3),
+    "tarifa":  (XPATH_TARIFA,  3, 3),
+    "taxa":    (XPATH_TAXA,    3, 3),
+    "cia":     (XPATH_CIA,     2, 2),
+}
+# Espera feita no próprio navegador, guiada por MutationObserver (sem intervalo fixo de poll):
+# 1 único round-trip por busca. Termina quando todos os campos têm texto, quando nenhum campo
+# apareceu na janela inicial (layout não casa) ou no prazo.
+JS_ESPERAR_CSS = """
+const [rootSel, sels, timeoutMs, janelaVaziaMs, done] = arguments;
+const textos = {};
+for (const k of Object.keys(sels)) textos[k] = '';
+let fim = false, agendado = false, obs = null;
+const finalizar = (semLayout) => {
+  if (fim) return;
+  fim = true;
+  if (obs) obs.disconnect();
+  clearTimeout(tPrazo); clearTimeout(tVazio);
+  done({textos, semLayout});
+};
+const checar = () => {
+  agendado = false;
+  if (fim) return;
+  const root = document.querySelector(rootSel);
+  for (const [k, sel] of Object.entries(sels)) {
+    if (textos[k]) continue;
+    const el = root ? root.querySelector(sel) : null;
+    textos[k] = el ? (el.innerText || '').trim() : '';
+  }
+  if (Object.values(textos).every(Boolean)) finalizar(false);
+};
+const tPrazo = setTimeout(() => { checar(); finalizar(false); }, timeoutMs);
+const tVazio = setTimeout(() => { checar(); if (!Object.values(textos).some(Boolean)) finalizar(true); }, janelaVaziaMs);
+checar();
+if (!fim) {
+  // várias mutações no mesmo instante viram 1 checagem
+  obs = new MutationObserver(() => { if (!agendado) { agendado = true; setTimeout(checar, 50); } });
+  obs.observe(document.body, {childList: true, subtree: true, characterData: true});
+}
+"""
+CSS_JANELA_VAZIA = 1.5  # s sem nenhum campo => layout não casa com o CSS
+
+# Locators montados 1x no import. Caminhos estruturais em CSS (querySelector nativo);
+# XPath só onde o critério é o texto do botão.
+LOC_NO_FLIGHTS    = (By.CSS_SELECTOR, "#flights > div > h3")
+LOC_TEXTO_COMPRAR = (By.XPATH, XPATH_TEXTO_COMPRAR)
+LOC_BOTAO_COMPRAR = (By.CSS_SELECTOR, "body > div:nth-of-type(1) > main > section > div:nth-of-type(2) > div:nth-of-type(3)"
+                                      " > div:nth-of-type(2) > div > div:nth-of-type(1) > div:nth-of-type(2) > button")
+LOC_RESUMO        = (By.CSS_SELECTOR, CSS_RESUMO)
 
 CENTER = Alignment(horizontal="center", vertical="center")
 HEADERS = [
@@ -56,53 +119,72 @@ HEADERS = [
     "DATA PARTIDA","HORA DA PARTIDA","DATA CHEGADA","HORA DA CHEGADA",
     "TARIFA","TX DE EMBARQUE","TOTAL","CIA DO VOO",
 ]
+NUMBER_FORMATS = {
+    "DATA DA BUSCA": "DD/MM/YYYY",
+    "HORA DA BUSCA": "HH:MM:SS",
+    "DATA PARTIDA": "DD/MM/YYYY",
+    "HORA DA PARTIDA": "HH:MM:SS",
+    "DATA CHEGADA": "DD/MM/YYYY",
+    "HORA DA CHEGADA": "HH:MM:SS",
+    "TARIFA": "#,##0.00",
+    "TX DE EMBARQUE": "#,##0.00",
+    "TOTAL": "#,##0.00",
+}
+# Estilos nomeados (centralizado + formato) registrados 1x por planilha: cada célula recebe só o nome,
+# sem montar Alignment/number_format célula a célula
+ESTILO_CENTRO = "centro"
+_ESTILOS = {ESTILO_CENTRO: "General", **{f"centro {fmt}": fmt for fmt in NUMBER_FORMATS.values()}}
+_ESTILO_COLS = [f"centro {NUMBER_FORMATS[h]}" if h in NUMBER_FORMATS else ESTILO_CENTRO for h in HEADERS]
 
 # ======= Helpers =======
+_RE_NAO_NUM  = re.compile(r"[^\d,\.]")
+_RE_DT_FULL  = re.compile(r'(\d{2})/(\d{2})/(\d{4})\s+(\d{2}):(\d{2})(?::(\d{2}))?')
+_RE_DT_DM    = re.compile(r'(\d{2})/(\d{2})\s+(\d{2}):(\d{2})(?::(\d{2}))?')
+_RE_HMS      = re.compile(r'(\d{2}):(\d{2})(?::(\d{2}))?')
+_RE_LINHAS   = re.compile(r'(?i)\blinhas a[eé]reas\b(?:\s+(s\.?\s*/?\s*a\.?)\b)?')
+_RE_MULTI_WS = re.compile(r'\s{2,}')
+
 def build_url(origin: str, destiny: str, departure_date: str) -> str:
     return ("https://flipmilhas.com/passagens"
             f"?adults=1&babies=0&back_date=&children=0&class=economica"
             f"&departure_date={departure_date}&destiny={destiny}&origin={origin}&rooms=1")
 
+@lru_cache(maxsize=4096)
 def brl_to_decimal(txt: str):
     if not txt: return None
-    s = re.sub(r"[^\d,\.]", "", txt).replace(".", "").replace(",", ".")
+    s = _RE_NAO_NUM.sub("", txt).replace(".", "").replace(",", ".")
     try: return Decimal(s)
     except (InvalidOperation, TypeError): return None
 
+@lru_cache(maxsize=4096)
 def parse_datetime_br(txt: str, fallback_date: date | None = None):
     if not txt: return None
     txt = txt.strip()
-    m = re.search(r'(\d{2})/(\d{2})/(\d{4})\s+(\d{2}):(\d{2})(?::(\d{2}))?', txt)
+    m = _RE_DT_FULL.search(txt)
     if m:
         d, mth, y, hh, mm, ss = m.groups(); ss = ss or "00"
         try: return datetime(int(y), int(mth), int(d), int(hh), int(mm), int(ss))
         except ValueError: return None
-    m = re.search(r'(\d{2})/(\d{2})\s+(\d{2}):(\d{2})(?::(\d{2}))?', txt)
+    m = _RE_DT_DM.search(txt)
     if m and fallback_date:
         d, mth, hh, mm, ss = m.groups(); ss = ss or "00"
         try: return datetime(fallback_date.year, int(mth), int(d), int(hh), int(mm), int(ss))
         except ValueError: return None
-    m = re.search(r'(\d{2}):(\d{2})(?::(\d{2}))?', txt)
+    m = _RE_HMS.search(txt)
     if m and fallback_date:
         hh, mm, ss = m.groups(); ss = ss or "00"
         try: return datetime(fallback_date.year, fallback_date.month, fallback_date.day, int(hh), int(mm), int(ss))
         except ValueError: return None
     return None
 
+@lru_cache(maxsize=4096)
 def clean_cia_text(txt: str | None) -> str:
     if not txt: return ""
     s = txt.strip()
-    s = re.sub(r'(?i)\blinhas a[eé]reas\b(?:\s+(s\.?\s*/?\s*a\.?)\b)?', '', s)
-    s = re.sub(r'\s{2,}', ' ', s).strip(" -–,.;:/\t\n\r")
+    s = _RE_LINHAS.sub('', s)
+    s = _RE_MULTI_WS.sub(' ', s).strip(" -–,.;:/\t\n\r")
     return s
 
-def to_excel_naive(value):
-    if isinstance(value, datetime):
-        return value.replace(tzinfo=None)
-    if isinstance(value, dtime):
-        return value.replace(tzinfo=None)
-    return value
-
 # ======= Excel =======
 def _is_valid_xlsx(path: str) -> bool:
     try:
@@ -128,10 +210,15 @@ def _create_new_workbook(path: str):
         ws.cell(row=1, column=j).alignment = CENTER
     wb.save(path); wb.close()
 
+# planilhas já conferidas/criadas neste processo: os ciclos seguintes não refazem a checagem do zip
+# nem o load_workbook extra da aba
+_XLSX_OK: set[str] = set()
+
 def ensure_workbook(path: str):
+    if path in _XLSX_OK: return
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
     if not os.path.exists(path) or not _is_valid_xlsx(path):
-        _create_new_workbook(path); return
+        _create_new_workbook(path); _XLSX_OK.add(path); return
     wb = load_workbook(path)
     if SHEET_NAME not in wb.sheetnames:
         ws = wb.create_sheet(SHEET_NAME)
@@ -140,212 +227,245 @@ def ensure_workbook(path: str):
             ws.cell(row=1, column=j).alignment = CENTER
         wb.save(path)
     wb.close()
-
-def append_row(path: str, row_values: dict):
-    ensure_workbook(path)
-    wb = load_workbook(path)
-    ws = wb[SHEET_NAME]
-    if ws.max_row == 1 and all((c.value is None for c in ws[1])):
-        ws.append(HEADERS)
-        for j in range(1, len(HEADERS)+1):
-            ws.cell(row=1, column=j).alignment = CENTER
-
-    clean = {k: to_excel_naive(v) for k, v in row_values.items()}
-    row = [clean.get(h) for h in HEADERS]
-    ws.append(row)
-    r = ws.max_row
-
-    fmt = {
-        "DATA DA BUSCA": "DD/MM/YYYY",
-        "HORA DA BUSCA": "HH:MM:SS",
-        "DATA PARTIDA": "DD/MM/YYYY",
-        "HORA DA PARTIDA": "HH:MM:SS",
-        "DATA CHEGADA": "DD/MM/YYYY",
-        "HORA DA CHEGADA": "HH:MM:SS",
-        "TARIFA": "#,##0.00",
-        "TX DE EMBARQUE": "#,##0.00",
-        "TOTAL": "#,##0.00",
-    }
-    for c_idx, hdr in enumerate(HEADERS, start=1):
-        cell = ws.cell(row=r, column=c_idx)
-        if hdr in fmt and cell.value is not None:
-            cell.number_format = fmt[hdr]
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    wb.save(path)
-    wb.close()
+    _XLSX_OK.add(path)
+
+class WorkbookWriter:
+    """Planilha aberta durante o ciclo (1 load_workbook): append só mexe na aba em memória e o arquivo
+    é salvo a cada `salvar_cada` linhas (não perde o ciclo todo se o processo morrer) e ao sair.
+    Abre só na 1ª linha: ciclo sem linhas não toca no arquivo."""
+
+    def __init__(self, path: str, salvar_cada: int = 32):
+        self.path, self.salvar_cada = path, salvar_cada
+        self.wb = self.ws = None
+        self.total, self._pendentes = 0, 0
+
+    def __enter__(self):
+        return self
+
+    def _abrir(self):
+        ensure_workbook(self.path)
+        self.wb = load_workbook(self.path)
+        self.ws = self.wb[SHEET_NAME]
+        for nome, fmt in _ESTILOS.items():
+            if nome not in self.wb.named_styles:
+                self.wb.add_named_style(NamedStyle(name=nome, alignment=CENTER, number_format=fmt))
+        if self.ws.max_row == 1 and all((c.value is None for c in self.ws[1])):
+            self.ws.append(HEADERS)
+            for j in range(1, len(HEADERS)+1):
+                self.ws.cell(row=1, column=j).alignment = CENTER
+
+    def append(self, row_values: dict):
+        if self.wb is None:
+            self._abrir()
+        self.ws.append([to_excel_naive(row_values.get(h)) for h in HEADERS])
+        for cell, estilo in zip(self.ws[self.ws.max_row], _ESTILO_COLS):
+            cell.style = estilo if cell.value is not None else ESTILO_CENTRO
+        self.total += 1; self._pendentes += 1
+        if self._pendentes >= self.salvar_cada:
+            self.save()
+
+    def save(self):
+        if self._pendentes:
+            self.wb.save(self.path)
+            self._pendentes = 0
+
+    def __exit__(self, *exc):
+        if self.wb is not None:
+            self.save()
+            self.wb.close()
+        return False
 
 # ======= Selenium =======
-def _maybe_set_binary_location(opts: Options):
-    """Usa CHROME_PATH do GitHub Action se existir; caso contrário deixa Selenium Manager resolver."""
-    chrome_path = os.getenv("CHROME_PATH") or os.getenv("GOOGLE_CHROME_SHIM")
-    if chrome_path and os.path.exists(chrome_path):
-        opts.binary_location = chrome_path
-        logging.info("Usando CHROME_PATH: %s", chrome_path)
-
-
-def setup_driver(headless: bool = True):
+def setup_driver(headless: bool = True, profile_dir: str | None = None, script_timeout: float = 30):
+    """Chrome p/ o scraper. Só esperas explícitas (WebDriverWait/execute_async_script): implicit wait
+    fica em 0, senão cada find_element somaria o seu prazo ao do WebDriverWait."""
     options = Options()
     if headless:
         options.add_argument("--headless=new")
         options.add_argument("--window-size=1920,1080")
         options.add_argument("--hide-scrollbars")
-    _maybe_set_binary_location(options)
+    maybe_set_binary_location(options)
+
+    # Perfil persistente: cookies/consentimento e cache HTTP sobrevivem entre execuções
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        options.add_argument(f"--user-data-dir={profile_dir}")
+        options.add_argument("--profile-directory=Default")
 
     # Flags que estabilizam no CI
     options.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
     options.add_experimental_option("useAutomationExtension", False)
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--log-level=3")
-    options.add_argument("--mute-audio")
-    options.add_argument("--no-default-browser-check")
-    options.add_argument("--no-first-run")
-    options.add_argument("--disable-notifications")
-
-    # Selenium Manager resolve o driver automaticamente.
-    driver_path = os.getenv("CHROMEDRIVER_PATH")
-    service = ChromeService(executable_path=driver_path) if driver_path and os.path.exists(driver_path) else ChromeService()
-    driver = webdriver.Chrome(service=service, options=options)
-    logging.info("Chrome binary: %s | chromedriver: %s", getattr(options, "binary_location", None), (driver_path or "selenium-manager"))
+    for flag in CHROME_FLAGS:
+        options.add_argument(flag)
+    options.add_argument("--disable-gpu")  # só texto: sem composição por GPU
+    options.add_experimental_option("prefs", CHROME_PREFS)
+
+    # Selenium Manager resolve o driver só na 1ª vez (CHROMEDRIVER_PATH tem prioridade).
+    driver = new_chrome(options)
+    driver.set_script_timeout(script_timeout)  # mesmo orçamento da espera assíncrona do resumo (+ folga)
+    logging.info("Chrome binary: %s | chromedriver: %s", getattr(options, "binary_location", None), driver.service.path)
     wait = WebDriverWait(driver, 15)
     return driver, wait
 
 
-def navigate_same_tab(driver, url):
-    try:
-        driver.execute_script("window.location.assign(arguments[0]);", url)
-    except Exception:
-        driver.get(url)
+def _status_listagem(driver):
+    """Condição única p/ WebDriverWait: 'no_flights', 'buy_ready' ou False (continua esperando)."""
+    for el in driver.find_elements(*LOC_NO_FLIGHTS):
+        if "nenhum voo" in (el.text or "").strip().lower():
+            return "no_flights"
+    for loc in (LOC_TEXTO_COMPRAR, LOC_BOTAO_COMPRAR):
+        if driver.find_elements(*loc):
+            return "buy_ready"
+    return False
 
 
 def wait_for_buy_button_or_no_flights(driver, max_wait):
-    start = time.time()
-    while time.time() - start < max_wait:
-        try:
-            el = WebDriverWait(driver, 1).until(EC.presence_of_element_located((By.XPATH, XPATH_NO_FLIGHTS)))
-            txt = (el.text or "").strip().lower()
-            if "nenhum voo" in txt:
-                return "no_flights"
-        except TimeoutException:
-            pass
-        for xp in (XPATH_TEXTO_COMPRAR, XPATH_BOTAO_COMPRAR):
-            try:
-                if WebDriverWait(driver, 1).until(EC.presence_of_element_located((By.XPATH, xp))):
-                    return "buy_ready"
-            except TimeoutException:
-                pass
-        time.sleep(1)
-    return "timeout"
+    try:
+        return WebDriverWait(driver, max_wait, poll_frequency=0.25,
+                             ignored_exceptions=(StaleElementReferenceException,)).until(_status_listagem)
+    except TimeoutException:
+        return "timeout"
+
+
+# 1º "Comprar" visível (mais acima, depois mais à esquerda) achado, rolado e clicado numa única chamada
+JS_CLICAR_COMPRAR = """
+const r = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const vis = [];
+for (let i = 0; i < r.snapshotLength; i++) {
+  const e = r.snapshotItem(i);
+  if (e.getClientRects().length) vis.push([e, e.getBoundingClientRect()]);
+}
+if (!vis.length) return false;
+vis.sort((a, b) => (a[1].top - b[1].top) || (a[1].left - b[1].left));
+vis[0][0].scrollIntoView({block: 'center'});
+vis[0][0].click();
+return true;
+"""
 
 
 def js_click_first_buy(driver) -> bool:
     try:
-        btns = driver.find_elements(By.XPATH, XPATH_TEXTO_COMPRAR)
-        btns = [b for b in btns if b.is_displayed()]
-        btns.sort(key=lambda e: (e.rect.get('y', 1e9), e.rect.get('x', 1e9)))
-        for el in btns:
-            try:
-                driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-                time.sleep(0.05)
-                driver.execute_script("arguments[0].click();", el)
-                return True
-            except Exception:
-                continue
-    except Exception:
+        if driver.execute_script(JS_CLICAR_COMPRAR, XPATH_TEXTO_COMPRAR):
+            return True
+    except JavascriptException:
         pass
     try:
-        el = WebDriverWait(driver, 6).until(EC.visibility_of_element_located((By.XPATH, XPATH_BOTAO_COMPRAR)))
-        driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-        driver.execute_script("arguments[0].click();", el)
+        el = WebDriverWait(driver, 6).until(EC.visibility_of_element_located(LOC_BOTAO_COMPRAR))
+        driver.execute_script("arguments[0].scrollIntoView({block:'center'}); arguments[0].click();", el)
         return True
     except TimeoutException:
         return False
 
 
-def wait_text(driver, xpath, timeout=12):
+def wait_element(driver, locator, timeout=12):
     try:
-        el = WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.XPATH, xpath)))
-        return (el.text or "").strip()
+        return WebDriverWait(driver, timeout).until(EC.presence_of_element_located(locator))
     except TimeoutException:
         return None
 
 
-def wait_text_retry(driver, xpath, tries=3, delay=3):
-    for _ in range(tries):
-        txt = wait_text(driver, xpath, timeout=8)
-        if txt: return txt
-        time.sleep(delay)
-    return None
+def wait_text(driver, xpath, timeout=12, root=None):
+    """Espera o texto ficar não-vazio. Com `root`, o XPath é avaliado relativo ao nó."""
+    ctx = root if root is not None else driver
+
+    def _texto(_d):
+        return (ctx.find_element(By.XPATH, xpath).text or "").strip() or False
+
+    try:
+        return WebDriverWait(driver, timeout, ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)).until(_texto)
+    except TimeoutException:
+        return None
+
+
+def wait_text_retry(driver, xpath, tries=3, delay=3, root=None):
+    # 1 espera contínua com o mesmo orçamento das antigas tentativas + sleeps fixos
+    return wait_text(driver, xpath, timeout=tries * 8 + (tries - 1) * delay, root=root)
+
+
+def esperar_css(driver, root_sel: str, sels: dict, timeout=12) -> tuple[dict, bool]:
+    """Espera os seletores com MutationObserver no navegador; devolve (textos, sem_layout)."""
+    try:
+        res = driver.execute_async_script(JS_ESPERAR_CSS, root_sel, sels,
+                                          int(timeout * 1000), int(CSS_JANELA_VAZIA * 1000)) or {}
+    except WebDriverException:
+        return {}, True
+    return res.get("textos") or {}, bool(res.get("semLayout"))
+
+
+def ler_resumo(driver, resumo, timeout=12) -> dict:
+    """Espera o lote CSS até todos os campos aparecerem. O fallback XPath (caro: 1 espera por campo)
+    só roda com orçamento cheio se nenhum campo CSS apareceu em CSS_JANELA_VAZIA (layout não casa);
+    no fim do prazo, os que faltarem ganham só 1 conferida curta."""
+    textos, sem_layout = esperar_css(driver, CSS_RESUMO, CSS_CAMPOS, timeout=timeout)
+    for campo, (xp, tries, delay) in XPATH_CAMPOS.items():
+        if textos.get(campo):
+            continue
+        if sem_layout:
+            textos[campo] = wait_text_retry(driver, xp, tries=tries, delay=delay, root=resumo)
+        else:
+            textos[campo] = wait_text(driver, xp, timeout=1, root=resumo)
+    return textos
 
 
 # ======= 1 passo (trecho+ADVP) =======
-def processar_trecho_advp(driver, base_tab, out_path, origin, destiny, advp, espera):
-    data_voo = (datetime.now(TZ) + timedelta(days=advp)).date()
-    url = build_url(origin, destiny, data_voo.strftime("%Y-%m-%d"))
+def row_sem_ofertas(trecho_str: str) -> dict:
+    now = datetime.now(TZ)
+    return {
+        "DATA DA BUSCA": now.date(),
+        "HORA DA BUSCA": dtime(now.hour, now.minute, now.second),
+        "TRECHO": trecho_str,
+        "DATA PARTIDA": None,
+        "HORA DA PARTIDA": None,
+        "DATA CHEGADA": None,
+        "HORA DA CHEGADA": None,
+        "TARIFA": None,
+        "TX DE EMBARQUE": None,
+        "TOTAL": None,
+        "CIA DO VOO": "Sem Ofertas",
+    }
+
+
+def build_tasks(trechos=TRECHOS, advps=ADVP_LIST):
+    """Lista de trabalho pré-montada 1x por ciclo: (origem, destino, advp, url, data_voo)."""
+    hoje = datetime.now(TZ).date()
+    datas = {advp: hoje + timedelta(days=advp) for advp in advps}
+    return [(o, d, advp, build_url(o, d, datas[advp].strftime("%Y-%m-%d")), datas[advp])
+            for (o, d) in dict.fromkeys(trechos) for advp in dict.fromkeys(advps)]  # sem repetidos
+
+
+def processar_trecho_advp(driver, base_tab, tarefa, espera):
+    """Faz 1 tarefa de build_tasks; retorna (linha, base_tab). A gravação fica a cargo do `WorkbookWriter`."""
+    origin, destiny, _advp, url, data_voo = tarefa
     trecho_str = f"{origin}-{destiny}"
 
     try: driver.switch_to.window(base_tab)
     except Exception: base_tab = driver.current_window_handle
-    navigate_same_tab(driver, url)
+    navigate_same_tab(driver, url, (LOC_TEXTO_COMPRAR, LOC_NO_FLIGHTS))
 
     status = wait_for_buy_button_or_no_flights(driver, espera)
 
     if status in ("no_flights", "timeout"):
-        now = datetime.now(TZ)
-        row = {
-            "DATA DA BUSCA": now.date(),
-            "HORA DA BUSCA": dtime(now.hour, now.minute, now.second),
-            "TRECHO": trecho_str,
-            "DATA PARTIDA": None,
-            "HORA DA PARTIDA": None,
-            "DATA CHEGADA": None,
-            "HORA DA CHEGADA": None,
-            "TARIFA": None,
-            "TX DE EMBARQUE": None,
-            "TOTAL": None,
-            "CIA DO VOO": "Sem Ofertas",
-        }
-        append_row(out_path, row)
-        return base_tab
+        return row_sem_ofertas(trecho_str), base_tab
 
     old_handles = set(driver.window_handles)
+    url_listagem = driver.current_url
     if not js_click_first_buy(driver):
-        now = datetime.now(TZ)
-        row = {
-            "DATA DA BUSCA": now.date(),
-            "HORA DA BUSCA": dtime(now.hour, now.minute, now.second),
-            "TRECHO": trecho_str,
-            "DATA PARTIDA": None,
-            "HORA DA PARTIDA": None,
-            "DATA CHEGADA": None,
-            "HORA DA CHEGADA": None,
-            "TARIFA": None,
-            "TX DE EMBARQUE": None,
-            "TOTAL": None,
-            "CIA DO VOO": "Sem Ofertas",
-        }
-        append_row(out_path, row)
-        return base_tab
+        return row_sem_ofertas(trecho_str), base_tab
 
     switched = False
-    try:
-        WebDriverWait(driver, 6).until(lambda d: len(d.window_handles) > len(old_handles))
-        new_handle = [h for h in driver.window_handles if h not in old_handles]
-        if new_handle:
-            driver.switch_to.window(new_handle[-1])
-            switched = True
-    except TimeoutException:
-        pass
+    new_handle = wait_new_tab_or_nav(driver, old_handles, url_listagem)
+    if new_handle:
+        driver.switch_to.window(new_handle)
+        switched = True
 
     # 2ª página
-    partida_txt = wait_text_retry(driver, XPATH_PARTIDA, tries=3, delay=3)
-    chegada_txt = wait_text_retry(driver, XPATH_CHEGADA, tries=3, delay=3)
-    tarifa_txt  = wait_text_retry(driver, XPATH_TARIFA,  tries=3, delay=3)
-    taxa_txt    = wait_text_retry(driver, XPATH_TAXA,    tries=3, delay=3)
-    cia_txt     = wait_text_retry(driver, XPATH_CIA,     tries=2, delay=2)
+    resumo = wait_element(driver, LOC_RESUMO, timeout=24)
+    textos = ler_resumo(driver, resumo, timeout=max(12, espera)) if resumo is not None else {}
+    partida_txt = textos.get("partida") or None
+    chegada_txt = textos.get("chegada") or None
+    tarifa_txt  = textos.get("tarifa") or None
+    taxa_txt    = textos.get("taxa") or None
+    cia_txt     = textos.get("cia") or None
 
     partida_dt = parse_datetime_br(partida_txt, fallback_date=data_voo)
     chegada_dt = parse_datetime_br(chegada_txt, fallback_date=data_voo)
@@ -374,7 +494,6 @@ def processar_trecho_advp(driver, base_tab, out_path, origin, destiny, advp, esp
         "TOTAL": float(total_val) if total_val is not None else None,
         "CIA DO VOO": cia_clean,
     }
-    append_row(out_path, row)
 
     if switched:
         try: driver.close()
@@ -384,7 +503,7 @@ def processar_trecho_advp(driver, base_tab, out_path, origin, destiny, advp, esp
             driver.switch_to.window(driver.window_handles[0])
             base_tab = driver.current_window_handle
 
-    return base_tab
+    return row, base_tab
 
 
 # ======= MAIN =======
@@ -396,6 +515,14 @@ def main():
     parser.add_argument("--headless", action="store_true", help="Força headless")
     parser.add_argument("--gui",      dest="headless", action="store_false", help="Abre janela (debug local)")
     parser.add_argument("--once",     action="store_true", help="Roda apenas 1 ciclo e finaliza")
+    parser.add_argument("--perfil",   default=os.getenv("CHROME_PROFILE_DIR", os.path.expanduser("~/.cache/flipmilhas-chrome")),
+                        help="Pasta do perfil do Chrome reaproveitada entre execuções ('' desativa)")
+    parser.add_argument("--workers",  type=int, default=int(os.getenv("FLIP_WORKERS", "4")),
+                        help="Chromes em paralelo (1 driver por thread; com >1, perfil em <perfil>/w<N>)")
+    parser.add_argument("--reciclar", type=int, default=int(os.getenv("SCRAPER_RECICLAR", "25")),
+                        help="Recria cada Chrome a cada N buscas (0 = nunca)")
+    parser.add_argument("--cache-ttl", type=float, default=float(os.getenv("SCRAPER_CACHE_TTL", "0")),
+                        help="Pula a busca (trecho+data do voo) já feita há menos de N s (registro em SCRAPER_CACHE_DIR; 0 desliga)")
     parser.set_defaults(headless=True)  # no GitHub: headless por padrão
     args = parser.parse_args()
 
@@ -407,21 +534,54 @@ def main():
                         datefmt="%H:%M:%S")
     logging.info("Saída: %s | Planilha: %s | Aba: %s | Headless: %s", args.saida, args.file, SHEET_NAME, args.headless)
 
-    driver, _wait = setup_driver(headless=args.headless)
-    base_tab = driver.current_window_handle
+    workers = max(1, args.workers)
 
+    # Pool de drivers (1 Chrome por thread, reaproveitado entre ciclos).
+    # O Chrome trava o --user-data-dir, então cada worker tem a sua subpasta do perfil.
+    def _novo_driver(idx):
+        perfil = args.perfil or None
+        if perfil and workers > 1:
+            perfil = os.path.join(perfil, f"w{idx}")
+        drv, _wait = setup_driver(headless=args.headless, profile_dir=perfil,
+                                  script_timeout=max(12, args.espera) + 5)
+        return drv
+
+    pool = DriverPool(_novo_driver, max_usos=args.reciclar)
+
+    cache = CacheResultados(PASTA_CACHE, args.cache_ttl)
+
+    def _buscar(tarefa):
+        def _com(drv):
+            base_tab = getattr(pool.local, "base_tab", None) or drv.current_window_handle
+            row, pool.local.base_tab = processar_trecho_advp(
+                driver=drv, base_tab=base_tab, tarefa=tarefa, espera=args.espera,
+            )
+            return row
+        return pool.executar(_com)  # sessão morta => Chrome da thread é recriado na próxima busca
+
+    def _tarefa(tarefa):
+        origin, destiny, _advp, _url, data_voo = tarefa
+        return cache.obter(f"flip|{origin}-{destiny}|{data_voo.isoformat()}", lambda: _buscar(tarefa))
+
+    ex = ThreadPoolExecutor(max_workers=workers)
     try:
         def ciclo():
-            nonlocal base_tab
-            for (origin, destiny) in TRECHOS:
-                for advp in ADVP_LIST:
-                    try:
-                        base_tab = processar_trecho_advp(
-                            driver=driver, base_tab=base_tab, out_path=out_path,
-                            origin=origin, destiny=destiny, advp=advp, espera=args.espera
-                        )
-                    except Exception as e:
-                        logging.exception("Falha em %s-%s ADVP %d: %s", origin, destiny, advp, e)
+            with WorkbookWriter(out_path) as writer:
+                try:
+                    futs = {ex.submit(_tarefa, t): t for t in build_tasks()}
+                    for fut in as_completed(futs):
+                        origin, destiny, advp = futs[fut][:3]
+                        try:
+                            row = fut.result()
+                        except Exception as e:
+                            logging.exception("Falha em %s-%s ADVP %d: %s", origin, destiny, advp, e)
+                            continue
+                        if row is None:  # busca recente (--cache-ttl): a linha já está na saída anterior
+                            logging.info("Pulado (busca recente): %s-%s ADVP %d", origin, destiny, advp)
+                            continue
+                        writer.append(row)  # gravação só nesta thread
+                finally:
+                    logging.info("Gravadas %d linhas em %s", writer.total, out_path)
 
         if args.once:
             ciclo()
@@ -432,8 +592,8 @@ def main():
                 time.sleep(300)
 
     finally:
-        try: driver.quit()
-        except Exception: pass
+        ex.shutdown(wait=True, cancel_futures=True)
+        pool.quit()
         logging.info("Finalizado.")
 
 
@@ -1,28 +1,31 @@
 # maxmilhas_scraper_gha.py — GitHub Actions (1 ciclo, headless, 2ª página)
-# Saída: data/MAX_YYYYMMDD_HHMMSS.xlsx (aba "MAX")
+# Saída: data/MAX_YYYYMMDD_HHMMSS.parquet (+ output/MAX_YYYYMMDD_HHMMSS.xlsx, aba "MAX", com --xlsx / EMIT_XLSX)
 # Execução local: python maxmilhas_scraper_gha.py --once --headless
 # Baseado no loop do anexo (XPaths/colunas e extrações). 2ª página com "Comprar".  :contentReference[oaicite:1]{index=1}
 
-import os, re, time, argparse, logging
-from datetime import datetime, timedelta, date, time as dtime
+import os, re, json, argparse, logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from datetime import datetime, timedelta, time as dtime
 from decimal import Decimal, InvalidOperation
-from zoneinfo import ZoneInfo
-from zipfile import ZipFile
 
-from openpyxl import Workbook, load_workbook
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment
 
-from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import (TimeoutException, JavascriptException,
+                                        StaleElementReferenceException, WebDriverException)
+
+from scraper_common import (TZ, CHROME_FLAGS, CHROME_PREFS, DriverPool, CacheResultados, PASTA_CACHE, env_flag,
+                            maybe_set_binary_location, new_chrome, navigate_same_tab, wait_new_tab_or_nav,
+                            save_parquet, to_excel_naive)
 
 # ===================== CONFIG =====================
-TZ = ZoneInfo("America/Sao_Paulo")
 SHEET_NAME = "MAX"
 CENTER = Alignment(horizontal="center", vertical="center")
 
@@ -45,22 +48,72 @@ def build_url(origin: str, destiny: str, departure_date: str) -> str:
     return f"https://www.maxmilhas.com.br/busca-passagens-aereas/OW/{origin}/{destiny}/{departure_date}/1/0/0/EC"
 
 # ===== XPaths (2ª página) — iguais ao anexo =====
-XP_BUY       = '//*[@id="__next"]/div[4]/section/div[5]/div[2]/div[1]/div/div/div[1]/div/div/div[2]/div[2]/div/div[2]/button'
+# Botão "Comprar" em CSS (querySelector nativo); o fallback por texto precisa de XPath
+CSS_BUY      = ("#__next > div:nth-of-type(4) > section > div:nth-of-type(5) > div:nth-of-type(2) > div:nth-of-type(1)"
+                " > div > div > div:nth-of-type(1) > div > div > div:nth-of-type(2) > div:nth-of-type(2) > div"
+                " > div:nth-of-type(2) > button")
 XP_BUY_FALL  = "//button[contains(., 'Comprar') or contains(., 'COMPRAR')]"
-
-XP_HR_PART   = '//*[@id="__next"]/div[4]/section/div[2]/div/div/div/article/div/div[1]/div[1]/div[2]'
-XP_HR_CHEG   = '//*[@id="__next"]/div[4]/section/div[2]/div/div/div/article/div/div[1]/div[1]/div[4]'
-
-XP_COL_G_TARIFA = '//*[@id="__next"]/div[4]/section/div[3]/div[1]/div/div[3]/div/div[1]/div/span[2]'
-XP_COL_J_TOTAL  = ('//*[@id="__next"]/div[4]/section/div[3]/div[1]/div/div[3]/div/div[4]/span[2]'
-                   ' | //*[@id="__next"]/div[3]/div[1]/div/div[3]/div/div[4]/span[2]')
-XP_COL_N_TIPO   = ('//*[@id="__next"]/div[4]/section/div[2]/div/div/div/article/div/div[1]/div[2]/ul/li[4]'
-                   ' | //*[@id="__next"]//article//div[1]/div[2]//li[contains(., "Tarifa")]')
-
-XP_TX_EMB   = '//*[@id="__next"]/div[3]/div[1]/div/div[3]/div/div[3]/span/div[1]/span[2] | //*[@id="__next"]/div[4]/section/div[3]/div[1]/div/div[3]/div/div[3]/span/div[1]/span[2]'
-XP_TX_EMIS  = '//*[@id="__next"]/div[3]/div[1]/div/div[3]/div/div[3]/span/div[2]/span[2] | //*[@id="__next"]/div[4]/section/div[3]/div[1]/div/div[3]/div/div[3]/span/div[2]/span[2]'
-XP_DESC     = '//*[@id="__next"]/div[3]/div[1]/div/div[3]/div/div[2]/span/div/span[2] | //*[@id="__next"]/div[4]/section/div[3]/div[1]/div/div[3]/div/div[2]/span/div/span[2]'
-XP_CIA      = '//*[@id="__next"]/div[4]/section/div[2]/div/div/div/article/div/div[2]/div/div[1]/ul/li[3]'
+LOC_BUY      = (By.CSS_SELECTOR, CSS_BUY)
+LOC_BUY_FALL = (By.XPATH, XP_BUY_FALL)
+# “sem resultados”: regex sobre o innerText (V8), em vez de contains(.) em todos os nós do documento
+RE_SEM_RESULTADOS = "nenhum voo|sem resultados|não encontramos"
+
+# Sonda única da listagem (1 round-trip por poll): 'buy', 'empty' ou null
+JS_STATUS_LISTAGEM = """
+const first = (xp) => document.evaluate(xp, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (document.querySelector(arguments[0])) return 'buy';
+const r = document.evaluate(arguments[1], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (let i = 0; i < r.snapshotLength; i++) {
+  if (r.snapshotItem(i).getClientRects().length) return 'buy';
+}
+const texto = (document.querySelector('main') || document.body || {}).innerText || '';
+if (new RegExp(arguments[2], 'i').test(texto)) return 'empty';
+return null;
+"""
+
+# Âncoras resolvidas 1x por leitura; os campos são XPaths curtos relativos a elas
+RAIZES_2A = {
+    "artigo": ['//*[@id="__next"]/div[4]/section/div[2]/div/div/div/article'],
+    "preco":  ['//*[@id="__next"]/div[4]/section/div[3]/div[1]/div/div[3]/div',   # layout com <section>
+               '//*[@id="__next"]/div[3]/div[1]/div/div[3]/div'],                 # layout sem <section>
+}
+# campo -> alternativas (raiz, xpath relativo), tentadas na ordem; raiz None = documento inteiro
+CAMPOS_2A = {
+    "hr_ida":   [("artigo", "./div/div[1]/div[1]/div[2]")],
+    "hr_volta": [("artigo", "./div/div[1]/div[1]/div[4]")],
+    "cia":      [("artigo", "./div/div[2]/div/div[1]/ul/li[3]")],
+    "tipo":     [("artigo", "./div/div[1]/div[2]/ul/li[4]"),
+                 ("artigo", './/div[1]/div[2]//li[contains(., "Tarifa")]')],   # fallback só dentro do card
+    "tarifa":   [("preco", "./div[1]/div/span[2]")],
+    "desc":     [("preco", "./div[2]/span/div/span[2]")],
+    "tx_emb":   [("preco", "./div[3]/span/div[1]/span[2]")],
+    "tx_emis":  [("preco", "./div[3]/span/div[2]/span[2]")],
+    "total":    [("preco", "./div[4]/span[2]")],
+}
+CAMPOS_OBRIGATORIOS = ("hr_ida", "tarifa", "total", "cia")
+_JS_FN_LER = """function (raizesDef, camposDef, so) {
+  const first = (xp, ctx) => document.evaluate(xp, ctx, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+  const raizes = {};  // resolvidas sob demanda: só as âncoras dos campos pedidos
+  const raiz = (nome) => raizes[nome] || (raizes[nome] = raizesDef[nome].map(xp => first(xp, document)).filter(Boolean));
+  const out = {};
+  for (const k of (so || Object.keys(camposDef))) {
+    out[k] = '';
+    busca: for (const [r, xp] of camposDef[k]) {
+      for (const ctx of (r ? raiz(r) : [document])) {
+        const el = first(xp, ctx);
+        const t = el ? (el.innerText || '').trim() : '';  // só texto visível, como WebElement.text
+        if (t) { out[k] = t; break busca; }
+      }
+    }
+  }
+  return out;
+}"""
+# Versão genérica: locators enviados como argumentos a cada chamada
+JS_LER_XPATHS = f"return ({_JS_FN_LER})(arguments[0], arguments[1], arguments[2]);"
+# Versão instalada na página (locators da 2ª página embutidos): cada poll só chama window.__maxLer(faltando)
+JS_INIT_LER = (f"window.__maxLer = ((fn, r, c) => (so) => fn(r, c, so))"
+               f"({_JS_FN_LER}, {json.dumps(RAIZES_2A)}, {json.dumps(CAMPOS_2A)});")
+JS_CHAMAR_LER = "return window.__maxLer ? window.__maxLer(arguments[0]) : null;"
 
 HEADERS = [
     "DATA DA BUSCA","HORA DA BUSCA","TRECHO",
@@ -70,234 +123,213 @@ HEADERS = [
 ]
 
 # ===================== Helpers =====================
+_RE_NAO_NUM     = re.compile(r"[^\d,\.]")
+_RE_HMS         = re.compile(r'(\d{2}):(\d{2})(?::(\d{2}))?')
+_RE_LINHAS      = re.compile(r'(?i)\blinhas a[eé]reas\b')
+_RE_MULTI_WS    = re.compile(r'\s{2,}')
+_RE_WS          = re.compile(r'\s+')
+_RE_TARIFA      = re.compile(r'(?i)tarifa\s*([A-Z])\b')
+_RE_LETRA_SOLTA = re.compile(r'\b([A-Z])\b')
+
+# Helpers puros str -> valor imutável: memoizados (horários, preços e CIAs se repetem muito)
+@lru_cache(maxsize=4096)
 def brl_to_decimal(txt: str):
     if not txt: return None
-    s = re.sub(r"[^\d,\.]", "", txt).replace(".", "").replace(",", ".")
+    s = _RE_NAO_NUM.sub("", txt).replace(".", "").replace(",", ".")
     try: return Decimal(s)
     except (InvalidOperation, TypeError): return None
 
+@lru_cache(maxsize=4096)
 def parse_time_only(txt: str):
     if not txt: return None
-    m = re.search(r'(\d{2}):(\d{2})(?::(\d{2}))?', txt.strip())
+    m = _RE_HMS.search(txt.strip())
     if not m: return None
     hh, mm, ss = m.groups(); ss = ss or "00"
     try: return dtime(int(hh), int(mm), int(ss))
     except ValueError: return None
 
+@lru_cache(maxsize=4096)
 def clean_cia_text(txt: str | None) -> str:
     if not txt: return ""
     s = txt.strip()
-    s = re.sub(r'(?i)\blinhas a[eé]reas\b', '', s)
-    s = re.sub(r'\s{2,}', ' ', s).strip(" -–,.;:/\t\n\r")
+    s = _RE_LINHAS.sub('', s)
+    s = _RE_MULTI_WS.sub(' ', s).strip(" -–,.;:/\t\n\r")
     return s
 
+@lru_cache(maxsize=4096)
 def extract_letra_tarifa(txt: str | None) -> str | None:
     if not txt: return None
-    t = re.sub(r'\s+', ' ', txt).strip()
-    m = re.search(r'(?i)tarifa\s*([A-Z])\b', t)
+    t = _RE_WS.sub(' ', txt).strip()
+    m = _RE_TARIFA.search(t)
     if m: return m.group(1).upper()
-    m2 = re.findall(r'\b([A-Z])\b', t)
+    m2 = _RE_LETRA_SOLTA.findall(t)
     return m2[-1].upper() if m2 else None
 
-def to_excel_naive(v):
-    if isinstance(v, datetime): return v.replace(tzinfo=None)
-    if isinstance(v, dtime):    return v.replace(tzinfo=None)
-    return v
-
 # ===================== Excel =====================
-def _is_valid_xlsx(path: str) -> bool:
-    try:
-        if not os.path.isfile(path): return False
-        with ZipFile(path, "r") as zf:
-            return "[Content_Types].xml" in zf.namelist()
-    except Exception:
-        return False
-
-def _create_new_workbook(path: str):
-    from openpyxl import Workbook
-    from openpyxl.utils import get_column_letter
-    wb = Workbook(); ws = wb.active; ws.title = SHEET_NAME
-    ws.append(HEADERS)
-    widths = {
-        "DATA DA BUSCA":14,"HORA DA BUSCA":12,"TRECHO":12,
-        "DATA DO VOO":14,"HR IDA":12,"HR VOLTA":12,
-        "TARIFA":14,"DESCONTO":14,"TX DE EMBARQUE":16,"VALOR COM TAXA":16,
-        "TX DE  EMISSÃO":16,"TOTAL":14,"CIA DO VOO":22,"TIPO (A/C)":12
-    }
-    for j, hdr in enumerate(HEADERS, start=1):
-        ws.column_dimensions[get_column_letter(j)].width = widths.get(hdr, 16)
-        ws.cell(row=1, column=j).alignment = CENTER
-    wb.save(path); wb.close()
-
-def ensure_workbook(path: str):
+# Formato numérico por índice de coluna (0-based, na ordem de HEADERS)
+NUMBER_FORMATS = {
+    0:"DD/MM/YYYY", 1:"HH:MM:SS", 3:"DD/MM/YYYY", 4:"HH:MM:SS", 5:"HH:MM:SS",
+    6:"#,##0.00", 7:"#,##0.00", 8:"#,##0.00", 9:"#,##0.00", 10:"#,##0.00", 11:"#,##0.00"
+}
+COL_WIDTHS = {
+    "DATA DA BUSCA":14,"HORA DA BUSCA":12,"TRECHO":12,
+    "DATA DO VOO":14,"HR IDA":12,"HR VOLTA":12,
+    "TARIFA":14,"DESCONTO":14,"TX DE EMBARQUE":16,"VALOR COM TAXA":16,
+    "TX DE  EMISSÃO":16,"TOTAL":14,"CIA DO VOO":22,"TIPO (A/C)":12
+}
+
+def open_workbook(path: str):
+    """Planilha write-only: as linhas vão para o buffer de escrita conforme chegam (sem recarregar o arquivo)."""
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    if not os.path.exists(path) or not _is_valid_xlsx(path):
-        _create_new_workbook(path); return
-    wb = load_workbook(path)
-    if SHEET_NAME not in wb.sheetnames:
-        ws = wb.create_sheet(SHEET_NAME)
-        ws.append(HEADERS)
-        for j in range(1, len(HEADERS)+1):
-            ws.cell(row=1, column=j).alignment = CENTER
-        wb.save(path)
-    wb.close()
-
-def append_row(path: str, row_values: list):
-    ensure_workbook(path)
-    wb = load_workbook(path); ws = wb[SHEET_NAME]
-    ws.append([to_excel_naive(v) for v in row_values])
-    r = ws.max_row
-    numfmt = {
-        1:"DD/MM/YYYY", 2:"HH:MM:SS", 4:"DD/MM/YYYY", 5:"HH:MM:SS", 6:"HH:MM:SS",
-        7:"#,##0.00", 8:"#,##0.00", 9:"#,##0.00", 10:"#,##0.00", 11:"#,##0.00", 12:"#,##0.00"
-    }
-    for c in range(1, len(HEADERS)+1):
-        cell = ws.cell(row=r, column=c)
-        if c in numfmt and cell.value is not None:
-            cell.number_format = numfmt[c]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_NAME)
+    for j, hdr in enumerate(HEADERS, start=1):
+        ws.column_dimensions[get_column_letter(j)].width = COL_WIDTHS.get(hdr, 16)
+    header = []
+    for hdr in HEADERS:
+        cell = WriteOnlyCell(ws, value=hdr); cell.alignment = CENTER
+        header.append(cell)
+    ws.append(header)
+    return wb, ws
+
+def write_row(ws, row_values: list):
+    """Acrescenta 1 linha com formato/alinhamento já definidos em cada célula."""
+    cells = []
+    for j, v in enumerate(row_values):
+        cell = WriteOnlyCell(ws, value=to_excel_naive(v))
+        fmt = NUMBER_FORMATS.get(j)
+        if fmt and v is not None:
+            cell.number_format = fmt
         cell.alignment = CENTER
-    wb.save(path); wb.close()
+        cells.append(cell)
+    ws.append(cells)
 
 # ===================== Selenium =====================
-def _maybe_set_binary_location(opts: Options):
-    chrome_path = os.getenv("CHROME_PATH") or os.getenv("GOOGLE_CHROME_SHIM")
-    if chrome_path and os.path.exists(chrome_path):
-        opts.binary_location = chrome_path
-
 def setup_driver(headless=True):
     options = Options()
     if headless:
         options.add_argument("--headless=new")
         options.add_argument("--window-size=1920,1080")
         options.add_argument("--hide-scrollbars")
-    _maybe_set_binary_location(options)
+    maybe_set_binary_location(options)
     options.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
     options.add_experimental_option("useAutomationExtension", False)
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--log-level=3")
-    options.add_argument("--mute-audio")
-    options.add_argument("--no-default-browser-check")
-    options.add_argument("--no-first-run")
-    options.add_argument("--disable-notifications")
+    for flag in CHROME_FLAGS:
+        options.add_argument(flag)
     options.add_argument("--lang=pt-BR")
     options.add_argument("--use-gl=swiftshader")
     options.add_argument("--enable-unsafe-swiftshader")
-    service = ChromeService()
-    driver = webdriver.Chrome(service=service, options=options)
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option("prefs", CHROME_PREFS)
+    driver = new_chrome(options)  # implicit wait 0 + bloqueio de URLS_BLOQUEADAS
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": JS_INIT_LER})
+    except Exception as e:
+        logging.warning("Script de leitura não instalado via CDP: %s", e)
     wait = WebDriverWait(driver, 15)
     return driver, wait
 
-def navigate_same_tab(driver, url):
-    try:
-        driver.execute_script("window.location.assign(arguments[0]);", url)
-    except Exception:
-        driver.get(url)
-
 def wait_buy_or_empty(driver, max_wait=20):
-    t0 = time.time()
-    while time.time() - t0 < max_wait:
-        try:
-            if WebDriverWait(driver, 1.5).until(EC.presence_of_element_located((By.XPATH, XP_BUY))):
-                return "buy"
-        except TimeoutException:
-            pass
-        try:
-            btns = [b for b in driver.find_elements(By.XPATH, XP_BUY_FALL) if b.is_displayed()]
-            if btns: return "buy"
-        except Exception:
-            pass
-        # “sem resultados”
-        try:
-            if driver.find_elements(By.XPATH, "//*[contains(., 'Nenhum voo') or contains(., 'sem resultados') or contains(., 'não encontramos')]"):
-                return "empty"
-        except Exception:
-            pass
-        time.sleep(1)
-    return "timeout"
+    try:
+        return WebDriverWait(driver, max_wait, poll_frequency=0.25, ignored_exceptions=(JavascriptException,)).until(
+            lambda d: d.execute_script(JS_STATUS_LISTAGEM, CSS_BUY, XP_BUY_FALL, RE_SEM_RESULTADOS))
+    except TimeoutException:
+        return "timeout"
 
 def click_buy_js(driver) -> bool:
+    # Só falhas "esperadas" de localizar/clicar são engolidas; WebDriverException sobe p/ o main registrar
     try:
-        el = WebDriverWait(driver, 6).until(EC.presence_of_element_located((By.XPATH, XP_BUY)))
-        driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-        time.sleep(0.05)
-        driver.execute_script("arguments[0].click();", el)
+        el = WebDriverWait(driver, 6).until(EC.presence_of_element_located(LOC_BUY))
+        driver.execute_script("arguments[0].scrollIntoView({block:'center'}); arguments[0].click();", el)
         return True
-    except Exception:
+    except (TimeoutException, StaleElementReferenceException, JavascriptException):
+        pass
+    try:
+        btns = [b for b in driver.find_elements(*LOC_BUY_FALL) if b.is_displayed()]
+        btns.sort(key=lambda e: (e.rect.get('y', 1e9), e.rect.get('x', 1e9)))
+    except StaleElementReferenceException:
+        return False
+    for b in btns:
         try:
-            btns = [b for b in driver.find_elements(By.XPATH, XP_BUY_FALL) if b.is_displayed()]
-            btns.sort(key=lambda e: (e.rect.get('y', 1e9), e.rect.get('x', 1e9)))
-            for b in btns:
-                try:
-                    driver.execute_script("arguments[0].scrollIntoView({block:'center'});", b)
-                    time.sleep(0.05)
-                    driver.execute_script("arguments[0].click();", b)
-                    return True
-                except Exception:
-                    continue
-        except Exception:
-            return False
+            driver.execute_script("arguments[0].scrollIntoView({block:'center'}); arguments[0].click();", b)
+            return True
+        except (StaleElementReferenceException, JavascriptException):
+            continue
     return False
 
-def get_text(driver, xpath, timeout=10):
+def ler_campos(driver, raizes=RAIZES_2A, campos=CAMPOS_2A, obrigatorios=CAMPOS_OBRIGATORIOS, timeout=12) -> dict:
+    """Lê os campos em 1 round-trip por poll até os obrigatórios aparecerem (ou timeout).
+    Campo achado fica guardado; os polls seguintes só pedem os que ainda faltam."""
+    achados = {k: "" for k in campos}
+    instalado = raizes is RAIZES_2A and campos is CAMPOS_2A
+
+    def _ler(d, faltando):
+        if not instalado:
+            return d.execute_script(JS_LER_XPATHS, raizes, campos, faltando)
+        out = d.execute_script(JS_CHAMAR_LER, faltando)
+        if out is None:  # aba nova (o script do CDP vale só p/ a aba original): instala 1x aqui
+            d.execute_script(JS_INIT_LER)
+            out = d.execute_script(JS_CHAMAR_LER, faltando)
+        return out
+
+    def _pronto(d):
+        faltando = [k for k, v in achados.items() if not v]
+        achados.update({k: v for k, v in (_ler(d, faltando) or {}).items() if v})
+        return all(achados.get(k) for k in obrigatorios)
+
     try:
-        el = WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.XPATH, xpath)))
-        return (el.text or "").strip()
+        WebDriverWait(driver, timeout, poll_frequency=0.5).until(_pronto)
     except TimeoutException:
-        return None
-
-def get_text_multi(driver, xps, timeout=10):
-    for xp in xps:
-        txt = get_text(driver, xp, timeout)
-        if txt: return txt
-    return None
+        pass
+    return achados
 
 # ===================== 1 busca =====================
-def run_one_search(driver, origin, destiny, advp, out_path, espera):
+def build_tasks(trechos=TRECHOS, advps=ADVP_LIST):
+    """Lista de trabalho pré-montada 1x por ciclo: (origem, destino, advp, url, data_voo)."""
+    hoje = datetime.now(TZ).date()
+    datas = {advp: hoje + timedelta(days=advp) for advp in advps}
+    return [(o, d, advp, build_url(o, d, datas[advp].strftime("%Y-%m-%d")), datas[advp])
+            for (o, d) in dict.fromkeys(trechos) for advp in dict.fromkeys(advps)]  # sem repetidos
+
+def run_one_search(driver, tarefa, espera):
+    """Faz 1 busca (tupla de build_tasks) e devolve a linha (lista na ordem de HEADERS); quem grava é o main()."""
+    origin, destiny, advp, url, data_voo = tarefa
     now = datetime.now(TZ)
     data_busca = now.date()
     hora_busca = dtime(now.hour, now.minute, now.second)
-    data_voo   = (now + timedelta(days=advp)).date()
     trecho_str = f"{origin}-{destiny}"
-    url = build_url(origin, destiny, data_voo.strftime("%Y-%m-%d"))
 
     logging.info("Trecho %s | ADVP %d | URL: %s", trecho_str, advp, url)
-    navigate_same_tab(driver, url)
+    navigate_same_tab(driver, url, (LOC_BUY, LOC_BUY_FALL))  # listagem vazia: sem âncora => navegação completa
 
     status = wait_buy_or_empty(driver, max_wait=espera)
     if status != "buy":
-        values = [data_busca, hora_busca, trecho_str, data_voo, None, None, None, None, None, None, None, None, "Sem Ofertas", ""]
-        append_row(out_path, values); return
+        return [data_busca, hora_busca, trecho_str, data_voo, None, None, None, None, None, None, None, None, "Sem Ofertas", ""]
 
     old = set(driver.window_handles)
+    url_listagem = driver.current_url
     if not click_buy_js(driver):
-        values = [data_busca, hora_busca, trecho_str, data_voo, None, None, None, None, None, None, None, None, "Sem Ofertas", ""]
-        append_row(out_path, values); return
+        return [data_busca, hora_busca, trecho_str, data_voo, None, None, None, None, None, None, None, None, "Sem Ofertas", ""]
 
     # troca de aba se abrir
     switched = False
-    try:
-        WebDriverWait(driver, 6).until(lambda d: len(d.window_handles) > len(old))
-        newh = [h for h in driver.window_handles if h not in old]
-        if newh:
-            driver.switch_to.window(newh[-1]); switched = True
-    except TimeoutException:
-        pass
-
-    # coleta 2ª página
-    hr_ida_txt   = get_text(driver, XP_HR_PART, timeout=12)
-    hr_volta_txt = get_text(driver, XP_HR_CHEG, timeout=12)
-
-    tarifa_g_txt = get_text(driver, XP_COL_G_TARIFA, timeout=12)
-    total_j_txt  = get_text_multi(driver, XP_COL_J_TOTAL.split("|"), timeout=12)
-    tx_emb_txt   = get_text_multi(driver, XP_TX_EMB.split("|"),      timeout=12)
-    tx_emis_txt  = get_text_multi(driver, XP_TX_EMIS.split("|"),     timeout=12)
-    desc_txt     = get_text_multi(driver, XP_DESC.split("|"),        timeout=10)
-    cia_txt      = get_text(driver, XP_CIA,                          timeout=10)
-
-    tipo_txt   = get_text_multi(driver, XP_COL_N_TIPO.split("|"), timeout=10)
+    newh = wait_new_tab_or_nav(driver, old, url_listagem)
+    if newh:
+        driver.switch_to.window(newh); switched = True
+
+    # coleta 2ª página (1 execute_script por poll em vez de 1 WebDriverWait por campo)
+    campos = ler_campos(driver, timeout=max(12, espera))
+    hr_ida_txt   = campos.get("hr_ida") or None
+    hr_volta_txt = campos.get("hr_volta") or None
+
+    tarifa_g_txt = campos.get("tarifa") or None
+    total_j_txt  = campos.get("total") or None
+    tx_emb_txt   = campos.get("tx_emb") or None
+    tx_emis_txt  = campos.get("tx_emis") or None
+    desc_txt     = campos.get("desc") or None
+    cia_txt      = campos.get("cia") or None
+
+    tipo_txt   = campos.get("tipo") or None
     tipo_letra = extract_letra_tarifa(tipo_txt) or ""
 
     hr_ida   = parse_time_only(hr_ida_txt)
@@ -322,48 +354,77 @@ def run_one_search(driver, origin, destiny, advp, out_path, espera):
         float(total_l) if total_l is not None else None,
         cia or "", tipo_letra
     ]
-    append_row(out_path, values)
 
     if switched:
         try: driver.close()
-        except: pass
+        except WebDriverException: pass
         try: driver.switch_to.window(driver.window_handles[0])
-        except: pass
+        except WebDriverException: pass
+    return values
 
 # ===================== MAIN =====================
 def main():
     ap = argparse.ArgumentParser(description="MaxMilhas scraper (CI/Actions).")
-    ap.add_argument("--saida",  default="data", help="Pasta para salvar Excel (raiz/data)")
+    ap.add_argument("--saida",  default="data", help="Pasta de saída (raiz/data)")
     ap.add_argument("--espera", type=int, default=20, help="Segundos p/ achar 'Comprar'/detalhes")
     ap.add_argument("--headless", action="store_true")
     ap.add_argument("--gui", dest="headless", action="store_false")
     ap.add_argument("--once", action="store_true", help="Roda 1 ciclo e finaliza")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("MAX_WORKERS", "4")),
+                    help="Chromes em paralelo (1 driver por thread)")
+    ap.add_argument("--reciclar", type=int, default=int(os.getenv("SCRAPER_RECICLAR", "25")),
+                    help="Recria cada Chrome a cada N buscas (0 = nunca)")
+    ap.add_argument("--cache-ttl", type=float, default=float(os.getenv("SCRAPER_CACHE_TTL", "0")),
+                    help="Pula a busca (trecho+data do voo) já feita há menos de N s (registro em SCRAPER_CACHE_DIR; 0 desliga)")
+    ap.add_argument("--xlsx", action="store_true", default=env_flag("EMIT_XLSX"),
+                    help="Grava também a planilha .xlsx (além do .parquet)")
+    ap.add_argument("--xlsx-dir", default="output",
+                    help="Pasta da planilha .xlsx; fora de --saida, senão o painel conta as linhas 2x")
     ap.set_defaults(headless=True)
     args = ap.parse_args()
 
     os.makedirs(args.saida, exist_ok=True)
-    # Nome: MAX_YYYYMMDD_HHMMSS.xlsx (America/Sao_Paulo)
+    # Nome: MAX_YYYYMMDD_HHMMSS.parquet/.xlsx (America/Sao_Paulo)
     stamp = datetime.now(TZ).strftime("%Y%m%d_%H%M%S")
-    out_path = os.path.join(args.saida, f"MAX_{stamp}.xlsx")
+    out_base = os.path.join(args.saida, f"MAX_{stamp}")
+    xlsx_path = os.path.join(args.xlsx_dir, f"MAX_{stamp}.xlsx")
 
     logging.basicConfig(level=logging.INFO,
                         format="%(asctime)s | %(levelname)s | %(message)s",
                         datefmt="%H:%M:%S")
-    logging.info("Planilha: %s | Aba: %s | Headless: %s", out_path, SHEET_NAME, args.headless)
+    logging.info("Saída: %s.parquet%s | Headless: %s", out_base, f" (+ {xlsx_path})" if args.xlsx else "", args.headless)
+
+    wb, ws = open_workbook(xlsx_path) if args.xlsx else (None, None)
+    rows = []
+
+    # Pool de drivers: cada thread cria o seu Chrome na 1ª tarefa e o reaproveita nas seguintes
+    pool = DriverPool(lambda _idx: setup_driver(headless=args.headless)[0], max_usos=args.reciclar)
+
+    cache = CacheResultados(PASTA_CACHE, args.cache_ttl)
 
-    ensure_workbook(out_path)
-    driver, _wait = setup_driver(headless=args.headless)
-    base_tab = driver.current_window_handle
+    def _tarefa(tarefa):
+        origin, destiny, _advp, _url, data_voo = tarefa
+        return cache.obter(f"max|{origin}-{destiny}|{data_voo.isoformat()}",
+                           lambda: pool.executar(lambda drv: run_one_search(drv, tarefa, espera=args.espera)))
 
     try:
         def ciclo():
-            nonlocal base_tab
-            for (origin, destiny) in TRECHOS:
-                for advp in ADVP_LIST:
+            tarefas = build_tasks()
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+                futs = {ex.submit(_tarefa, t): t for t in tarefas}
+                for fut in as_completed(futs):
+                    origin, destiny, advp = futs[fut][:3]
                     try:
-                        run_one_search(driver, origin, destiny, advp, out_path=out_path, espera=args.espera)
+                        row = fut.result()
                     except Exception as e:
                         logging.exception("Falha em %s-%s ADVP %d: %s", origin, destiny, advp, e)
+                        continue
+                    if row is None:  # busca recente (--cache-ttl): a linha já está na saída anterior
+                        logging.info("Pulado (busca recente): %s-%s ADVP %d", origin, destiny, advp)
+                        continue
+                    rows.append(row)  # linhas juntadas/gravadas só nesta thread
+                    if ws is not None:
+                        write_row(ws, row)
 
         if args.once:
             ciclo()
@@ -371,8 +432,13 @@ def main():
             ciclo()  # no CI normalmente rodamos --once; aqui deixo 1 ciclo por padrão
 
     finally:
-        try: driver.quit()
-        except Exception: pass
+        pool.quit()
+        if not rows:
+            logging.warning("Nenhuma linha coletada; nada gravado.")
+        else:  # grava mesmo se o ciclo falhar no meio
+            save_parquet(out_base + ".parquet", HEADERS, rows)
+            if wb is not None:
+                wb.save(xlsx_path)  # write-only: 1 único save
         logging.info("Finalizado.")
 
 if __name__ == "__main__":
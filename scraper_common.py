@@ -0,0 +1,334 @@
+# scraper_common.py — peças compartilhadas pelos scrapers (FlipMilhas / MaxMilhas)
+# Chrome enxuto + cache do chromedriver, bloqueio de recursos via CDP, navegação SPA e troca de aba.
+
+import os, json, time, shutil, hashlib, logging, threading, itertools
+from datetime import datetime, time as dtime
+from zoneinfo import ZoneInfo
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (TimeoutException, JavascriptException, WebDriverException,
+                                        InvalidSessionIdException, NoSuchWindowException)
+
+TZ = ZoneInfo("America/Sao_Paulo")
+
+
+def env_flag(nome: str, padrao: bool = False) -> bool:
+    """Liga/desliga por variável de ambiente: "1/true/yes/sim/on" liga; "0/false/no/..." ou vazio desliga."""
+    valor = (os.getenv(nome) or "").strip().lower()
+    if not valor:
+        return padrao
+    return valor in ("1", "true", "yes", "sim", "on")
+
+# ======= Chrome =======
+# Flags comuns: Chrome enxuto p/ scraping de texto (menos processos de fundo, menos RSS por worker).
+# Fica o --headless=new: o headless antigo saiu do binário do Chrome (132+).
+CHROME_FLAGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--disable-extensions",
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--log-level=3",
+    "--mute-audio",
+    "--no-default-browser-check",
+    "--no-first-run",
+    "--disable-notifications",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--metrics-recording-only",
+    "--disable-features=Translate,BackForwardCache,AcceptCHFrame,InterestFeedContentSuggestions,"
+    "OptimizationHints,MediaRouter",
+]
+
+# Prefs comuns: sem imagens e sem pedido de permissão de notificação
+CHROME_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.notifications": 2,
+}
+
+# Recursos que não alimentam o scraping (bloqueados via CDP). CSS fica liberado:
+# is_displayed()/getClientRects dependem do layout para ignorar botões e avisos escondidos.
+URLS_BLOQUEADAS = [
+    "*.png", "*.jpg", "*.jpeg", "*.webp", "*.avif", "*.gif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3",
+    "*google-analytics*", "*googletagmanager*", "*doubleclick*",
+    "*facebook*", "*hotjar*", "*onetrust*", "*clarity.ms*",
+]
+
+# Caminhos resolvidos pelo Selenium Manager na 1ª criação de driver; os drivers seguintes
+# (workers, reciclagem) reaproveitam e não rodam a resolução de novo.
+_BINARIOS: dict = {}
+_BINARIOS_LOCK = threading.Lock()
+
+
+def maybe_set_binary_location(opts: Options):
+    """Usa CHROME_PATH do GitHub Action se existir; caso contrário deixa Selenium Manager resolver."""
+    chrome_path = os.getenv("CHROME_PATH") or os.getenv("GOOGLE_CHROME_SHIM")
+    if chrome_path and os.path.exists(chrome_path):
+        opts.binary_location = chrome_path
+        logging.info("Usando CHROME_PATH: %s", chrome_path)
+
+
+def _chrome_service(opts: Options) -> ChromeService:
+    driver_path = os.getenv("CHROMEDRIVER_PATH")
+    if driver_path and os.path.exists(driver_path):
+        return ChromeService(executable_path=driver_path)
+    with _BINARIOS_LOCK:
+        cache = dict(_BINARIOS)
+    if not cache.get("driver"):
+        # chromedriver no PATH (ex.: setup-chrome do Actions) dispensa rodar o Selenium Manager
+        no_path = shutil.which("chromedriver")
+        return ChromeService(executable_path=no_path) if no_path else ChromeService()
+    if cache.get("browser") and not opts.binary_location:
+        opts.binary_location = cache["browser"]
+    return ChromeService(executable_path=cache["driver"])
+
+
+def _lembrar_binarios(driver, opts: Options):
+    with _BINARIOS_LOCK:
+        if not _BINARIOS.get("driver") and driver.service.path:
+            _BINARIOS.update(driver=driver.service.path, browser=opts.binary_location or None)
+
+
+# Instalado em todo documento: window.open e links target=_blank navegam na própria aba
+# (o "Comprar" deixa de abrir aba nova; wait_new_tab_or_nav continua cobrindo os dois casos)
+JS_MESMA_ABA = """
+window.open = function (url) { if (url && url !== 'about:blank') location.assign(url); return window; };
+document.addEventListener('click', (e) => {
+  const a = e.target && e.target.closest && e.target.closest('a[target="_blank"]');
+  if (a) a.target = '_self';
+}, true);
+"""
+
+
+def new_chrome(options: Options, page_load_timeout: float | None = None):
+    """Cria o Chrome com as `options` já montadas pelo scraper. Só esperas explícitas (implicit wait 0),
+    recursos de URLS_BLOQUEADAS cortados via CDP e JS_MESMA_ABA em todo documento. Carga "eager":
+    driver.get volta no DOMContentLoaded — quem lê a página já espera pelo elemento que precisa."""
+    options.page_load_strategy = "eager"
+    driver = webdriver.Chrome(service=_chrome_service(options), options=options)
+    _lembrar_binarios(driver, options)
+    driver.implicitly_wait(0)
+    if page_load_timeout is None:  # lido aqui (não no import): valor inválido não derruba o scraper
+        try:
+            page_load_timeout = float(os.getenv("SCRAPER_PAGELOAD", "30"))
+        except ValueError:
+            logging.warning("SCRAPER_PAGELOAD inválido (%r); usando 30 s.", os.getenv("SCRAPER_PAGELOAD"))
+            page_load_timeout = 30.0
+    driver.set_page_load_timeout(page_load_timeout)
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": URLS_BLOQUEADAS})
+    except WebDriverException as e:
+        logging.warning("Bloqueio de URLs via CDP indisponível: %s", e)
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": JS_MESMA_ABA})
+    except WebDriverException as e:
+        logging.warning("window.open na mesma aba indisponível via CDP: %s", e)
+    return driver
+
+
+class DriverPool:
+    """1 Chrome por thread do ThreadPoolExecutor: criado na 1ª tarefa da thread (`criar(idx)`, idx
+    sequencial por worker) e reaproveitado nas seguintes, inclusive entre ciclos. Com `max_usos`,
+    o driver é recriado (mesmo idx) a cada max_usos tarefas, limitando o crescimento de memória do
+    Chrome. `local` guarda o estado por thread que o scraper quiser associar ao driver. `executar` descarta o
+    driver só quando a sessão morreu (sessão inválida/janela perdida, ou o driver não responde mais)."""
+
+    def __init__(self, criar, max_usos: int = 0):
+        self._criar, self.max_usos = criar, max_usos
+        self._drivers, self._lock = [], threading.Lock()
+        self._seq = itertools.count()
+        self.local = threading.local()
+
+    def get(self):
+        drv = getattr(self.local, "driver", None)
+        if drv is not None and self.max_usos and self.local.usos >= self.max_usos:
+            self.descartar()
+            drv = None
+        if drv is None:
+            idx = getattr(self.local, "idx", None)
+            if idx is None:
+                with self._lock:
+                    idx = next(self._seq)
+            drv = self._criar(idx)
+            with self._lock:
+                self._drivers.append(drv)
+            self.local.driver, self.local.idx, self.local.usos = drv, idx, 0
+        self.local.usos += 1
+        return drv
+
+    def executar(self, tarefa):
+        """Roda `tarefa(driver)` com o driver da thread. Se a sessão morreu no meio, o driver é descartado
+        antes de repassar o erro (a próxima tarefa da thread não herda a sessão quebrada); erros passageiros
+        (timeout, JS, elemento velho...) só sobem, sem perder o Chrome nem o perfil aquecido."""
+        drv = self.get()
+        try:
+            return tarefa(drv)
+        except (InvalidSessionIdException, NoSuchWindowException):
+            self.descartar()
+            raise
+        except Exception:
+            if not self._vivo(drv):
+                self.descartar()
+            raise
+
+    @staticmethod
+    def _vivo(drv) -> bool:
+        """Sonda barata: o chromedriver ainda responde por esta sessão?"""
+        try:
+            drv.window_handles
+            return True
+        except Exception:  # WebDriverException ou erro de conexão (chromedriver/Chrome fora do ar)
+            return False
+
+    def descartar(self):
+        """Fecha o driver da thread atual; o próximo get() cria outro com o mesmo idx."""
+        drv = getattr(self.local, "driver", None)
+        if drv is None:
+            return
+        idx = self.local.idx
+        self._fechar(drv)
+        self.local.__dict__.clear()  # estado do scraper (ex.: aba base) era do driver antigo
+        self.local.idx = idx
+
+    def _fechar(self, drv):
+        with self._lock:
+            if drv in self._drivers:  # quit() pode já ter esvaziado a lista
+                self._drivers.remove(drv)
+        try: drv.quit()
+        except Exception: pass
+
+    def quit(self):
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for drv in drivers:
+            try: drv.quit()
+            except Exception: pass
+
+
+# ======= Navegação =======
+# Navegação client-side (reaproveita o bundle já carregado): router do Vue/Nuxt (#app) ou do Next
+JS_SPA_PUSH = """
+const app = document.querySelector('#app');
+const r = (window.$nuxt && window.$nuxt.$router)
+  || (app && app.__vue_app__ && app.__vue_app__.config.globalProperties.$router)
+  || (app && app.__vue__ && app.__vue__.$router)
+  || (window.next && window.next.router);
+if (!r || typeof r.push !== 'function') return false;
+const u = new URL(arguments[0], location.href);
+if (u.origin !== location.origin) return false;
+r.push(u.pathname + u.search + u.hash);
+return true;
+"""
+JS_NA_ROTA = """
+const alvo = new URL(arguments[0], location.href), atual = new URLSearchParams(location.search);
+return location.pathname === alvo.pathname && [...alvo.searchParams].every(([k, v]) => atual.get(k) === v);
+"""
+
+
+def navigate_spa(driver, url, locators_antigos=(), timeout=5) -> bool:
+    """Tenta router.push; True só se a rota mudou e a listagem anterior (1º elemento achado
+    por `locators_antigos`) saiu do DOM. Sem esse elemento não há como saber quando a página velha
+    saiu (ex.: texto de "sem resultados" ainda na tela) => False, e quem chamou navega por completo."""
+    if not getattr(driver, "_spa_nav", True):
+        return False
+    antigos = []
+    for loc in locators_antigos:
+        antigos = driver.find_elements(*loc)
+        if antigos:
+            break
+    if not antigos:
+        return False
+    try:
+        if not driver.execute_script(JS_SPA_PUSH, url):
+            return False
+        WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+            lambda d: d.execute_script(JS_NA_ROTA, url)
+            and EC.staleness_of(antigos[0])(d))
+        return True
+    except (TimeoutException, JavascriptException):
+        driver._spa_nav = False  # site não respondeu ao push: volta a navegação completa neste driver
+        logging.info("Navegação SPA indisponível; usando navegação completa.")
+        return False
+
+
+def navigate_same_tab(driver, url, locators_antigos=()):
+    if navigate_spa(driver, url, locators_antigos):
+        return
+    try:
+        driver.execute_script("window.location.assign(arguments[0]);", url)
+    except JavascriptException:
+        driver.get(url)
+
+
+def wait_new_tab_or_nav(driver, old_handles: set, url_antes: str, timeout=6):
+    """Depois do clique em "Comprar": devolve o handle da aba nova assim que ela abrir, ou None
+    assim que a própria aba sair da URL da listagem (sem pagar o prazo inteiro nesse caso)."""
+    def _mudou(d):
+        novas = [h for h in d.window_handles if h not in old_handles]
+        if novas:
+            return novas[-1]
+        return "mesma_aba" if d.current_url != url_antes else False
+
+    try:
+        res = WebDriverWait(driver, timeout, poll_frequency=0.2).until(_mudou)
+    except TimeoutException:
+        return None
+    return None if res == "mesma_aba" else res
+
+
+# ======= Cache de resultados =======
+# Pasta privada (fora de data/ e output/, que são publicados)
+PASTA_CACHE = os.getenv("SCRAPER_CACHE_DIR", os.path.expanduser("~/.cache/buscasmilhas-scraper"))
+
+
+class CacheResultados:
+    """Registro em disco das buscas recentes (1 JSON por busca, chave ex.: site|trecho|data do voo) p/ pular
+    a mesma busca repetida dentro de `ttl` segundos — ex.: execuções agendadas próximas. A linha dessa busca
+    já saiu no arquivo da execução anterior: regravá-la contaria a mesma observação 2x no painel, então o
+    acerto não devolve linha nenhuma. ttl <= 0 desliga."""
+
+    def __init__(self, pasta: str, ttl: float):
+        self.pasta, self.ttl = pasta, ttl
+        if ttl > 0:
+            os.makedirs(pasta, exist_ok=True)
+
+    def obter(self, chave: str, calcular):
+        """None se a busca foi feita há menos de `ttl`; senão roda `calcular()`, registra e devolve o resultado
+        (exceção não é registrada)."""
+        if self.ttl <= 0:
+            return calcular()
+        arq = os.path.join(self.pasta, hashlib.sha1(chave.encode()).hexdigest() + ".json")
+        try:
+            if time.time() - os.path.getmtime(arq) < self.ttl:
+                return None
+        except OSError:
+            pass
+        valor = calcular()
+        tmp = f"{arq}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"chave": chave, "em": datetime.now(TZ).isoformat()}, f)
+        os.replace(tmp, arq)  # troca atômica: leitor nunca vê arquivo pela metade
+        return valor
+
+
+# ======= Saída =======
+def save_parquet(path: str, headers: list[str], rows: list[list]):
+    """Grava as linhas (listas na ordem de `headers`) de uma vez: colunar + snappy, arquivo menor e
+    leitura rápida no painel."""
+    import pyarrow as pa, pyarrow.parquet as pq  # só a saída Parquet usa pyarrow
+    colunas = list(zip(*rows)) if rows else [()] * len(headers)  # linhas -> colunas, sem DataFrame no meio
+    pq.write_table(pa.table({h: list(c) for h, c in zip(headers, colunas)}), path, compression="snappy")
+
+
+def to_excel_naive(value):
+    """openpyxl não grava datetime/time com fuso."""
+    if isinstance(value, (datetime, dtime)):
+        return value.replace(tzinfo=None)
+    return value
@@ -4,10 +4,10 @@ from pathlib import Path
 from typing import List, Optional
 import math
 import re
+import hashlib
 import numpy as np
 import pandas as pd
 import streamlit as st
-import altair as alt
 
 # ==========================
 # Configuração base do app
@@ -54,64 +54,132 @@ DATA_DIR_DEFAULT = find_data_dir(Path(__file__).resolve())
 # ==========================
 # Leitura e normalização
 # ==========================
+DATA_EXTS = frozenset({".xlsx", ".xls", ".csv", ".parquet"})  # o que _read_one sabe ler
+
 @st.cache_data(show_spinner=False, ttl=120)
-def _list_files(data_dir: str, patterns: List[str] | None = None) -> List[Path]:
+def _list_files(data_dir: str) -> List[Path]:
+    # 1 varredura da pasta (sem globs sobrepostos nem dedup)
     p = Path(data_dir)
-    if not p.exists():
+    if not p.is_dir():
         return []
-    pats = patterns or [
-        "*.xlsx", "*.xls", "*.csv", "*.parquet",
-        "FLIPMILHAS_*.*", "CAPOVIAGENS_*.*", "MAXMILHAS_*.*", "123MILHAS_*.*"
-    ]
-    out: List[Path] = []
-    for pat in pats:
-        out.extend(sorted(p.glob(pat)))
-    # remove duplicatas preservando ordem
-    seen = set()
-    uniq: List[Path] = []
-    for f in out:
-        if f not in seen:
-            uniq.append(f); seen.add(f)
-    return uniq
+    arqs = [f for f in p.iterdir() if f.suffix.lower() in DATA_EXTS and f.is_file()]
+    # planilha gêmea de um .parquet (mesmo nome) é só espelho: lida 2x contaria as buscas em dobro
+    parquets = {f.stem for f in arqs if f.suffix.lower() == ".parquet"}
+    return sorted(f for f in arqs if f.suffix.lower() == ".parquet" or f.stem not in parquets)
+
+MONEY_COLS = ["TARIFA", "TX DE EMBARQUE", "TOTAL"]
+_RE_NAO_NUMERICO = re.compile(r"[^0-9,.-]")
+_RE_MARCA_BRL = re.compile(r",|R\$")  # vírgula decimal ou "R$" => texto no formato BRL
+_RE_MILHAR_BRL = re.compile(r"^-?\d{1,3}(?:\.\d{3})+$")  # "1.234", "1.234.567": ponto de milhar, sem decimais
+_BRL_P_DECIMAL = str.maketrans({".": None, ",": "."})  # "1.234,56" -> "1234.56" numa passada só
 
 def _to_float_series(s: pd.Series) -> pd.Series:
     if s.dtype.kind in ("i", "u", "f"):
         return s.astype(float)
-    txt = (
-        s.astype(str)
-        .str.replace(r"[^0-9,.-]", "", regex=True)
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
-    )
+    txt = s.astype(str).str.strip()
+    # formato decidido por valor: só o que tem marca BRL (vírgula, "R$" ou só pontos de milhar) passa pela
+    # limpeza (o "." ali é milhar); texto já numérico ("1234.56") vai direto p/ to_numeric
+    brl = txt.str.contains(_RE_MARCA_BRL, regex=True) | txt.str.match(_RE_MILHAR_BRL)
+    if brl.any():
+        limpo = (
+            txt[brl]
+            .str.replace(_RE_NAO_NUMERICO, "", regex=True)
+            .str.translate(_BRL_P_DECIMAL)
+        )
+        txt = txt.mask(brl, limpo)
     return pd.to_numeric(txt, errors="coerce")
 
+def _to_float_frame(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """Como _to_float_series, mas as colunas de texto passam juntas por 1 única cadeia de str ops."""
+    out = pd.DataFrame(index=df.index)
+    texto = [c for c in cols if df[c].dtype.kind not in ("i", "u", "f")]
+    for c in cols:
+        if c not in texto:
+            out[c] = df[c].astype(float)
+    if texto:
+        n = len(df)
+        empilhado = _to_float_series(pd.concat([df[c] for c in texto], ignore_index=True))
+        blocos = empilhado.to_numpy(dtype=float).reshape(len(texto), n)
+        for c, vals in zip(texto, blocos):
+            out[c] = vals
+    return out[cols]
+
+# prefixo do nome do arquivo -> empresa; depois, trechos do nome (todos precisam aparecer)
+_EMPRESA_PREFIXO = {
+    "CAPOVIAGENS_": "CAPO VIAGENS",
+    "FLIPMILHAS_": "FLIPMILHAS",
+    "MAXMILHAS_": "MAXMILHAS",
+    "MAX_": "MAXMILHAS",  # saída do maxmilhas_scraper_gha.py (MAX_YYYYMMDD_HHMMSS)
+    "123MILHAS_": "123MILHAS",
+}
+_EMPRESA_TRECHOS = (
+    (("FLIP",), "FLIPMILHAS"),
+    (("CAPO",), "CAPO VIAGENS"),
+    (("MAX", "MILHAS"), "MAXMILHAS"),
+    (("123", "MILHAS"), "123MILHAS"),
+)
+
 def detect_empresa_from_filename(name: str) -> str:
     u = name.upper()
-    if re.match(r"^CAPOVIAGENS_", u, flags=re.I):
-        return "CAPO VIAGENS"
-    if re.match(r"^FLIPMILHAS_", u, flags=re.I):
-        return "FLIPMILHAS"
-    if re.match(r"^MAXMILHAS_", u, flags=re.I):
-        return "MAXMILHAS"
-    if re.match(r"^123MILHAS_", u, flags=re.I):
-        return "123MILHAS"
-    if "FLIP" in u or "FLIPMILHAS" in u:
-        return "FLIPMILHAS"
-    if "CAPO" in u or "CAPOVIAGENS" in u:
-        return "CAPO VIAGENS"
-    if "MAX" in u and "MILHAS" in u:
-        return "MAXMILHAS"
-    if "123" in u and "MILHAS" in u:
-        return "123MILHAS"
+    for pfx, emp in _EMPRESA_PREFIXO.items():
+        if u.startswith(pfx):
+            return emp
+    for partes, emp in _EMPRESA_TRECHOS:
+        if all(p in u for p in partes):
+            return emp
     return "N/A"
 
+_RE_ESPACOS = re.compile(r"\s+")  # normalização dos nomes de coluna
+_COL_APELIDOS = {
+    "CIA": "CIA DO VOO",
+    "CIA DO VÔO": "CIA DO VOO",
+    "TX EMBARQUE": "TX DE EMBARQUE",
+    "TAXA DE EMBARQUE": "TX DE EMBARQUE",
+    "VALOR TOTAL": "TOTAL",
+    "VALOR": "TOTAL",
+}
+
+# versão da normalização (_read_normalizado, _to_float_series, detecção de empresa, apelidos...):
+# incremente ao mudar qualquer uma delas, senão o cache em disco segue servindo o frame antigo
+_CACHE_VERSAO = 3
+
+def _cache_path(p: Path, mtime: float) -> Path:
+    """Parquet já normalizado em data/.cache, chaveado por (versão, nome, mtime, tamanho) do arquivo original."""
+    return p.parent / ".cache" / f"{p.name}-v{_CACHE_VERSAO}-{int(mtime)}-{p.stat().st_size}.parquet"
+
 @st.cache_data(show_spinner=False, ttl=120)
 def _read_one(path: str, mtime: float) -> pd.DataFrame:
-    p = Path(path); ext = p.suffix.lower()
+    # cache em disco: sobrevive a reinícios do app (o st.cache_data é só da memória do processo)
+    p = Path(path)
+    cache = _cache_path(p, mtime)
+    if cache.exists():
+        try:
+            df = pd.read_parquet(cache)
+            # caminho absoluto não vai p/ o cache (pasta publicada): recolocado aqui, na posição de sempre
+            df.insert(df.columns.get_loc("ARQUIVO") + 1, "CAMINHO", str(p))
+            return df
+        except Exception:
+            pass
+    df = _read_normalizado(p)
+    if not df.empty:
+        try:
+            cache.parent.mkdir(exist_ok=True)
+            for velho in cache.parent.glob(f"{p.name}-*.parquet"):
+                velho.unlink(missing_ok=True)  # versões anteriores do mesmo arquivo
+            df.drop(columns="CAMINHO").to_parquet(cache, compression="zstd", index=False)
+        except Exception:
+            cache.unlink(missing_ok=True)  # coluna com tipos mistos etc.: segue sem cache em disco
+    return df
+
+def _read_normalizado(p: Path) -> pd.DataFrame:
+    ext = p.suffix.lower()
     # === leitura por extensão ===
     if ext in (".xlsx", ".xls"):
-        # .xlsx usa openpyxl, .xls usa xlrd
-        df = pd.read_excel(p)
+        # calamine (Rust) quando instalado; senão/arquivo que ele recusa: .xlsx usa openpyxl, .xls usa xlrd
+        try:
+            df = pd.read_excel(p, engine="calamine")
+        except Exception:
+            df = pd.read_excel(p)
     elif ext == ".csv":
         for sep in [";", ","]:
             try:
@@ -127,21 +195,16 @@ def _read_one(path: str, mtime: float) -> pd.DataFrame:
         return pd.DataFrame()
 
     # === normalização de colunas ===
-    colmap = {c: re.sub(r"\s+", " ", str(c)).strip().upper() for c in df.columns}
+    # nome normalizado + apelidos resolvidos num mapa só => 1 único rename (1 cópia do frame)
+    colmap = {c: _RE_ESPACOS.sub(" ", str(c)).strip().upper() for c in df.columns}
+    por_nome = {norm: orig for orig, norm in colmap.items()}
+    nomes = set(por_nome)
+    for apelido, alvo in _COL_APELIDOS.items():  # mesma prioridade da ordem do dicionário
+        if apelido in nomes and alvo not in nomes:
+            colmap[por_nome[apelido]] = alvo
+            nomes.discard(apelido); nomes.add(alvo)
     df = df.rename(columns=colmap)
 
-    ren = {
-        "CIA": "CIA DO VOO",
-        "CIA DO VÔO": "CIA DO VOO",
-        "TX EMBARQUE": "TX DE EMBARQUE",
-        "TAXA DE EMBARQUE": "TX DE EMBARQUE",
-        "VALOR TOTAL": "TOTAL",
-        "VALOR": "TOTAL",
-    }
-    for k, v in ren.items():
-        if k in df.columns and v not in df.columns:
-            df = df.rename(columns={k: v})
-
     required = [
         "DATA DA BUSCA", "HORA DA BUSCA", "TRECHO",
         "DATA PARTIDA", "HORA DA PARTIDA", "DATA CHEGADA", "HORA DA CHEGADA",
@@ -151,14 +214,20 @@ def _read_one(path: str, mtime: float) -> pd.DataFrame:
         if c not in df.columns:
             df[c] = np.nan
 
-    for c in ["TARIFA", "TX DE EMBARQUE", "TOTAL"]:
-        df[c] = _to_float_series(df[c])
+    # preços em float32: o painel só exibe/agrega em reais inteiros e a coluna ocupa metade da memória
+    df[MONEY_COLS] = _to_float_frame(df, MONEY_COLS).astype("float32")
 
     def combo_dt(dcol: str, tcol: str) -> pd.Series:
-        d = pd.to_datetime(df[dcol].astype(str).str.strip(), dayfirst=True, errors="coerce")
-        t = pd.to_datetime(df[tcol].astype(str).str.strip(), errors="coerce")
-        raw = df[dcol].astype(str).str.strip() + " " + df[tcol].astype(str).str.strip()
-        dt = pd.to_datetime(raw, dayfirst=True, errors="coerce").fillna(d).fillna(t)
+        # 1 parse da coluna inteira (data + hora); os fallbacks (só data, depois só hora) rodam só nas falhas
+        dtxt = df[dcol].astype(str).str.strip()
+        ttxt = df[tcol].astype(str).str.strip()
+        dt = pd.to_datetime(dtxt + " " + ttxt, dayfirst=True, errors="coerce", cache=True)
+        falhou = dt.isna()
+        if falhou.any():
+            dt = dt.fillna(pd.to_datetime(dtxt[falhou], dayfirst=True, errors="coerce", cache=True))
+            falhou = dt.isna()
+        if falhou.any():
+            dt = dt.fillna(pd.to_datetime(ttxt[falhou], errors="coerce", cache=True))
         return dt
 
     df["BUSCA_DATETIME"]   = combo_dt("DATA DA BUSCA", "HORA DA BUSCA")
@@ -179,21 +248,41 @@ def _read_one(path: str, mtime: float) -> pd.DataFrame:
     other = [c for c in df.columns if c not in base]
     return df[base + other]
 
+def _int_compacto(s: pd.Series, dtype: str) -> pd.Series:
+    # arredonda e anula o que não cabe no tipo: 1 linha ruim não derruba o painel; cast falhou => fica float
+    v = pd.to_numeric(s, errors="coerce").round()
+    info = np.iinfo(dtype.lower())
+    v = v.where(v.between(info.min, info.max))
+    try:
+        return v.astype(dtype)
+    except (TypeError, ValueError):
+        return v
+
 @st.cache_data(show_spinner=True, ttl=120)
 def load_all(data_dir: str) -> pd.DataFrame:
     files = _list_files(data_dir)
     if not files:
         return pd.DataFrame()
-    parts = []
+    parts, lidos = [], []
     for f in files:
         try:
-            parts.append(_read_one(str(f), f.stat().st_mtime))
+            st_f = f.stat()
+            parts.append(_read_one(str(f), st_f.st_mtime))
+            lidos.append(f"{f.name}:{st_f.st_mtime_ns}:{st_f.st_size}")
         except Exception as e:
             st.warning(f"Falha ao ler {f.name}: {e}")
     if not parts:
         return pd.DataFrame()
     df = pd.concat(parts, ignore_index=True)
+    # colunas dos filtros com tipos compactos (depois do concat: categorias diferentes por arquivo
+    # voltariam a object): isin compara códigos inteiros em vez de objetos Python
+    df["TRECHO"] = df["TRECHO"].astype("category")
+    df["EMPRESA"] = df["EMPRESA"].astype("category")
+    df["ADVP"] = _int_compacto(df["ADVP"], "Int16")
+    df["HORA_HH"] = _int_compacto(df["HORA_HH"], "Int8")
     df = df.sort_values("BUSCA_DATETIME", ascending=False, kind="stable")
+    # assinatura dos arquivos lidos: chave barata p/ os caches que recebem o frame sem hasheá-lo
+    df.attrs["sig"] = hashlib.sha1("|".join([data_dir, *lidos]).encode()).hexdigest()
     return df
 
 def fmt_moeda0(v) -> str:
@@ -270,18 +359,26 @@ advp_sel   = c3.multiselect("ADVP", options=advp_opts, default=[], placeholder="
 trecho_sel = c4.multiselect("Trechos", options=trecho_opts, default=[], placeholder="Todos")
 hora_sel   = c5.multiselect("Hora da busca", options=hora_opts, default=[], placeholder="Todas")
 
-mask = pd.Series(True, index=df_all.index)
-if d_ini and d_fim:
-    d0, d1 = pd.to_datetime(d_ini), pd.to_datetime(d_fim)
-    mask &= df_all["BUSCA_DATETIME"].dt.date.between(d0.date(), d1.date())
-if advp_sel:
-    mask &= df_all["ADVP"].isin(advp_sel)
-if trecho_sel:
-    mask &= df_all["TRECHO"].isin(trecho_sel)
-if hora_sel:
-    mask &= df_all["HORA_HH"].isin(hora_sel)
-
-view_all = df_all.loc[mask].copy()
+@st.cache_data(show_spinner=False, max_entries=32)
+def linhas_filtradas(_df: pd.DataFrame, sig: str, d_ini, d_fim, advp: tuple, trecho: tuple, hora: tuple) -> np.ndarray:
+    # _df não entra no hash do Streamlit: a chave é sig (arquivos lidos) + filtros.
+    # Cacheia só as posições das linhas (array de ints), não o frame: nada de cópias do dataset no cache
+    # máscaras como ndarray bool (sem alinhamento de índice entre Series); data por comparação int64 ns
+    masks = [np.ones(len(_df), dtype=bool)]
+    if d_ini and d_fim:
+        d0, d1 = pd.to_datetime(d_ini), pd.to_datetime(d_fim) + pd.Timedelta(days=1)
+        ts = _df["BUSCA_DATETIME"].to_numpy(dtype="datetime64[ns]")
+        masks.append((ts >= np.datetime64(d0, "ns")) & (ts < np.datetime64(d1, "ns")))  # NaT fica de fora
+    if advp:
+        masks.append(_df["ADVP"].isin(advp).to_numpy(dtype=bool, na_value=False))
+    if trecho:
+        masks.append(_df["TRECHO"].isin(trecho).to_numpy(dtype=bool, na_value=False))
+    if hora:
+        masks.append(_df["HORA_HH"].isin(hora).to_numpy(dtype=bool, na_value=False))
+    return np.flatnonzero(np.logical_and.reduce(masks))
+
+filtro_sig = (df_all.attrs.get("sig", ""), d_ini, d_fim, tuple(advp_sel), tuple(trecho_sel), tuple(hora_sel))
+view_all = df_all.iloc[linhas_filtradas(df_all, *filtro_sig)]
 st.caption(
     f"Linhas após filtros: **{len(view_all):,}** • Última atualização: **{df_all['BUSCA_DATETIME'].max():%d/%m/%Y - %H:%M:%S}**".replace(",", ".")
 )
@@ -290,52 +387,50 @@ st.markdown("---")
 # ======================================================
 # Helpers de gráfico
 # ======================================================
-def x_axis(field_and_type: str, title: Optional[str]=None, sort=None):
-    # sort é passado aqui corretamente (sem .sort() encadeado)
-    return alt.X(
-        field_and_type,
-        sort=sort if sort is not None else alt.Undefined,
-        axis=alt.Axis(title=title, labelAngle=0, labelOverlap=True,
-                      labelFontWeight="bold", labelColor=CINZA_TXT),
-    )
-
-def y_axis(enc: str, title: str="PREÇO", domain=None):
-    return alt.Y(
-        enc,
-        axis=alt.Axis(title=title, format=".0f", labelFontWeight="bold", labelColor=CINZA_TXT),
-        scale=alt.Scale(domain=domain) if domain is not None else alt.Undefined
-    )
+# specs Vega-Lite montadas como dict (st.vega_lite_chart): sem a validação/serialização de schema do Altair
+_VL_TIPOS = {"N": "nominal", "O": "ordinal", "Q": "quantitative"}
+
+def x_axis(field: str, x_type: str, title: Optional[str]=None, sort=None) -> dict:
+    enc = {
+        "field": field, "type": _VL_TIPOS[x_type],
+        "axis": {"title": title, "labelAngle": 0, "labelOverlap": True,
+                 "labelFontWeight": "bold", "labelColor": CINZA_TXT},
+    }
+    if sort is not None:
+        enc["sort"] = sort
+    return enc
+
+def y_axis(field: str, title: str="PREÇO", domain=None) -> dict:
+    enc = {
+        "field": field, "type": "quantitative",
+        "axis": {"title": title, "format": ".0f", "labelFontWeight": "bold", "labelColor": CINZA_TXT},
+    }
+    if domain is not None:
+        enc["scale"] = {"domain": domain}
+    return enc
 
 def barras_com_tendencia(df: pd.DataFrame, x_col: str, y_col: str, x_type: str,
                          titulo: str, *, x_title: Optional[str]=None,
                          y_max: Optional[int]=None, sort=None):
-    df = df.copy(); df["_LABEL"] = df[y_col].apply(fmt_pontos)
-
-    base = alt.Chart(df).encode(
-        x=x_axis(f"{x_col}:{x_type}", title=x_title, sort=sort),
-        y=y_axis(f"{y_col}:Q", domain=[0, y_max] if y_max else None),
-        tooltip=[x_col, alt.Tooltip(y_col, format=",.0f")],
-    )
-    bars = base.mark_bar(color=AMARELO)
-
-    labels = alt.Chart(df).encode(
-        x=x_axis(f"{x_col}:{x_type}", title=x_title, sort=sort),
-        y=y_axis(f"{y_col}:Q", domain=[0, y_max] if y_max else None),
-        text=alt.Text("_LABEL:N"),
-    ).mark_text(
-        baseline="top", align="center", dy=14, color=CINZA_TXT,
-        fontWeight="bold", size=18,
-    )
-
-    line = (
-        alt.Chart(df)
-        .mark_line(color=CINZA_TXT, opacity=0.95, strokeDash=[6,4])
-        .encode(x=x_axis(f"{x_col}:{x_type}", title=x_title, sort=sort),
-                y=y_axis(f"{y_col}:Q", domain=[0, y_max] if y_max else None))
-    )
-
-    ch = (bars + labels + line).properties(title=titulo, height=340)
-    st.altair_chart(ch, use_container_width=True)
+    df = df[[x_col, y_col]].copy(); df["_LABEL"] = df[y_col].apply(fmt_pontos)
+
+    x = x_axis(x_col, x_type, title=x_title, sort=sort)
+    y = y_axis(y_col, domain=[0, y_max] if y_max else None)
+    spec = {
+        "title": titulo, "height": 340,
+        "layer": [
+            {"mark": {"type": "bar", "color": AMARELO},
+             "encoding": {"x": x, "y": y, "tooltip": [
+                 {"field": x_col, "type": _VL_TIPOS[x_type]},
+                 {"field": y_col, "type": "quantitative", "format": ",.0f"}]}},
+            {"mark": {"type": "text", "baseline": "top", "align": "center", "dy": 14,
+                      "color": CINZA_TXT, "fontWeight": "bold", "size": 18},
+             "encoding": {"x": x, "y": y, "text": {"field": "_LABEL", "type": "nominal"}}},
+            {"mark": {"type": "line", "color": CINZA_TXT, "opacity": 0.95, "strokeDash": [6,4]},
+             "encoding": {"x": x, "y": y}},
+        ],
+    }
+    st.vega_lite_chart(df, spec, use_container_width=True)
 
 # ==========================
 # SHARE CIAS (stack normalizado + rótulos)
@@ -346,7 +441,7 @@ def chart_cia_stack_trecho(df_emp: pd.DataFrame):
         return
 
     cia_raw = df_emp["CIA DO VOO"].astype(str).str.upper()
-    df = df_emp.copy()
+    df = df_emp[["TRECHO"]].copy()  # o gráfico só usa TRECHO e CIA3
     df["CIA3"] = np.select(
         [cia_raw.str.contains("AZUL"), cia_raw.str.contains("GOL"), cia_raw.str.contains("LATAM")],
         ["AZUL", "GOL", "LATAM"],
@@ -357,55 +452,58 @@ def chart_cia_stack_trecho(df_emp: pd.DataFrame):
         st.info("Sem AZUL/GOL/LATAM para este filtro.")
         return
 
-    base = alt.Chart(df)
-
-    bars = (
-        base.mark_bar()
-        .encode(
-            x=x_axis("TRECHO:N"),
-            y=alt.Y(
-                "count():Q",
-                stack="normalize",
-                axis=alt.Axis(format=".0%", title=""),
-                scale=alt.Scale(domain=[0, 1.2]),
-            ),
-            color=alt.Color(
-                "CIA3:N",
-                scale=alt.Scale(
-                    domain=["AZUL", "GOL", "LATAM"],
-                    range=[AZUL_COLOR, GOL_COLOR, LATAM_COLOR],
-                ),
-                legend=alt.Legend(title="CIA"),
-            ),
-            order=alt.Order("CIA3:N", sort="ascending"),
-        )
-    )
-
-    text = (
-        base
-        .transform_aggregate(count="count()", groupby=["TRECHO", "CIA3"])
-        .transform_stack(
-            stack="count",
-            groupby=["TRECHO"],
-            sort=[alt.SortField("CIA3", order="ascending")],
-            as_=["y0", "y1"],
-            offset="normalize",
-        )
-        .transform_calculate(
-            ycenter="(datum.y0 + datum.y1)/2",
-            label="format(datum.y1 - datum.y0, '.0%')",
-        )
-        .mark_text(baseline="middle", align="center", size=18, fontWeight="bold", color="#FFFFFF")
-        .encode(
-            x=x_axis("TRECHO:N"),
-            y=alt.Y("ycenter:Q", scale=alt.Scale(domain=[0, 1.2])),
-            text="label:N",
-            detail="CIA3:N",
-        )
-    )
+    x = x_axis("TRECHO", "N")
+    spec = {
+        "title": "SHARE CIAS", "height": 380,
+        "layer": [
+            {"mark": "bar",
+             "encoding": {
+                 "x": x,
+                 "y": {"aggregate": "count", "type": "quantitative", "stack": "normalize",
+                       "axis": {"format": ".0%", "title": ""}, "scale": {"domain": [0, 1.2]}},
+                 "color": {"field": "CIA3", "type": "nominal",
+                           "scale": {"domain": ["AZUL", "GOL", "LATAM"],
+                                     "range": [AZUL_COLOR, GOL_COLOR, LATAM_COLOR]},
+                           "legend": {"title": "CIA"}},
+                 "order": {"field": "CIA3", "type": "nominal", "sort": "ascending"},
+             }},
+            {"transform": [
+                {"aggregate": [{"op": "count", "as": "count"}], "groupby": ["TRECHO", "CIA3"]},
+                {"stack": "count", "groupby": ["TRECHO"], "sort": [{"field": "CIA3", "order": "ascending"}],
+                 "as": ["y0", "y1"], "offset": "normalize"},
+                {"calculate": "(datum.y0 + datum.y1)/2", "as": "ycenter"},
+                {"calculate": "format(datum.y1 - datum.y0, '.0%')", "as": "label"},
+             ],
+             "mark": {"type": "text", "baseline": "middle", "align": "center", "size": 18,
+                      "fontWeight": "bold", "color": "#FFFFFF"},
+             "encoding": {
+                 "x": x,
+                 "y": {"field": "ycenter", "type": "quantitative", "scale": {"domain": [0, 1.2]}},
+                 "text": {"field": "label", "type": "nominal"},
+                 "detail": {"field": "CIA3", "type": "nominal"},
+             }},
+        ],
+    }
+    st.vega_lite_chart(df, spec, use_container_width=True)
 
-    ch = (bars + text).properties(title="SHARE CIAS", height=380)
-    st.altair_chart(ch, use_container_width=True)
+# ==========================
+# Agregações (1 groupby p/ gráficos e tabela)
+# ==========================
+@st.cache_data(show_spinner=False, max_entries=32)
+def precompute_aggs(_df: pd.DataFrame, filtro_sig: tuple) -> dict:
+    # mín/soma/contagem de TOTAL na granularidade mais fina; cada gráfico só re-agrega (média = soma/contagem)
+    # dropna=False: linha sem TRECHO continua contando no gráfico por hora (como no groupby por coluna)
+    tbl = (_df.groupby(["EMPRESA","HORA_HH","ADVP","TRECHO"], observed=True, dropna=False)["TOTAL"]
+              .agg(["min","sum","count"]).reset_index())
+    return {emp: g for emp, g in tbl.groupby("EMPRESA", sort=False, observed=True)}
+
+def _reagrega(aggs_emp: pd.DataFrame, chaves, menor_preco: bool) -> pd.DataFrame:
+    g = aggs_emp.groupby(chaves, as_index=False, observed=True)
+    if menor_preco:
+        return g["min"].min().rename(columns={"min":"PRECO"})
+    out = g[["sum","count"]].sum()
+    out["PRECO"] = out["sum"] / out["count"]  # contagem 0 (só TOTAL vazio) => NaN, como o mean()
+    return out.drop(columns=["sum","count"])
 
 # ==========================
 # Tabela Top 3
@@ -430,28 +528,25 @@ def _row_heat_css(row: pd.Series, price_cols: List[str]) -> pd.Series:
         if not pd.isna(v): styles[c]=interp(float(v))
     return pd.Series(styles)
 
-def top3_tabela(df_emp: pd.DataFrame, agg: str):
+def top3_tabela(aggs_emp: pd.DataFrame, agg: str):
     if agg not in ("min", "mean"): agg = "min"
 
-    if agg == "min":
-        base = (df_emp.groupby(["TRECHO","ADVP"], as_index=False)["TOTAL"].min()
-                .rename(columns={"TOTAL":"VAL"}))
-    else:
-        base = (df_emp.groupby(["TRECHO","ADVP"], as_index=False)["TOTAL"].mean()
-                .rename(columns={"TOTAL":"VAL"}))
+    base = _reagrega(aggs_emp, ["TRECHO","ADVP"], agg == "min").rename(columns={"PRECO":"VAL"})
 
-    rows=[]
-    for trecho, sub in base.groupby("TRECHO", sort=True):
-        top = sub.nsmallest(3, "VAL").reset_index(drop=True)
+    # colunas pré-alocadas (schema fixo) em vez de list[dict] -> inferência linha a linha
+    cols = ["TRECHO", "PREÇO TOP 1", "ADVP TOP 1", "PREÇO TOP 2", "ADVP TOP 2", "PREÇO TOP 3", "ADVP TOP 3"]
+    buf = {c: [] for c in cols}
+    for trecho, sub in base.groupby("TRECHO", sort=True, observed=True):
+        top = sub.nsmallest(3, "VAL")
         vals = top["VAL"].tolist(); advs = top["ADVP"].tolist()
-        rows.append({"TRECHO":trecho,
-                     "PREÇO TOP 1": vals[0] if len(vals)>0 else np.nan, "ADVP TOP 1":advs[0] if len(advs)>0 else np.nan,
-                     "PREÇO TOP 2": vals[1] if len(vals)>1 else np.nan, "ADVP TOP 2":advs[1] if len(advs)>1 else np.nan,
-                     "PREÇO TOP 3": vals[2] if len(vals)>2 else np.nan, "ADVP TOP 3":advs[2] if len(advs)>2 else np.nan})
-    if not rows:
+        buf["TRECHO"].append(trecho)
+        for i in range(3):
+            buf[f"PREÇO TOP {i+1}"].append(vals[i] if len(vals)>i else np.nan)
+            buf[f"ADVP TOP {i+1}"].append(advs[i] if len(advs)>i else np.nan)
+    if not buf["TRECHO"]:
         st.info("Sem dados para montar o Top 3 por trecho."); return
 
-    df_tbl = pd.DataFrame(rows).sort_values("TRECHO").reset_index(drop=True)
+    df_tbl = pd.DataFrame(buf, columns=cols)  # groupby(sort=True) já entrega os trechos em ordem
     df_tbl.index = pd.RangeIndex(start=1, stop=len(df_tbl)+1, step=1)
     df_tbl.index.name = None
 
@@ -466,7 +561,7 @@ def top3_tabela(df_emp: pd.DataFrame, agg: str):
 # ==========================
 # Render por empresa
 # ==========================
-def render_empresa(df_emp: pd.DataFrame, key_suffix: str):
+def render_empresa(df_emp: pd.DataFrame, aggs_emp: Optional[pd.DataFrame], key_suffix: str):
     menor_preco = st.toggle(
         "Menor preço",
         value=True,
@@ -489,10 +584,7 @@ def render_empresa(df_emp: pd.DataFrame, key_suffix: str):
 
     # 1) Preço por hora
     horas = pd.DataFrame({"HORA_HH": list(range(24))})
-    if menor_preco:
-        by_hora = df_emp.groupby("HORA_HH", as_index=False)["TOTAL"].min().rename(columns={"TOTAL":"PRECO"})
-    else:
-        by_hora = df_emp.groupby("HORA_HH", as_index=False)["TOTAL"].mean().rename(columns={"TOTAL":"PRECO"})
+    by_hora = _reagrega(aggs_emp, "HORA_HH", menor_preco)
     by_hora = horas.merge(by_hora, on="HORA_HH", how="left").fillna({"PRECO":0})
     y_max_hora = dynamic_limit(by_hora["PRECO"], hard_cap)
     barras_com_tendencia(by_hora, "HORA_HH", "PRECO", "O",
@@ -500,29 +592,20 @@ def render_empresa(df_emp: pd.DataFrame, key_suffix: str):
                          y_max=y_max_hora, sort=list(range(24)))
 
     # 2) Preço por ADVP
-    if menor_preco:
-        by_advp = df_emp.groupby("ADVP", as_index=False)["TOTAL"].min().rename(columns={"TOTAL":"PRECO"}).sort_values("ADVP")
-    else:
-        by_advp = df_emp.groupby("ADVP", as_index=False)["TOTAL"].mean().rename(columns={"TOTAL":"PRECO"}).sort_values("ADVP")
+    by_advp = _reagrega(aggs_emp, "ADVP", menor_preco).sort_values("ADVP")
     y_max_advp = dynamic_limit(by_advp["PRECO"], hard_cap)
     barras_com_tendencia(by_advp, "ADVP", "PRECO", "O",
                          "Preço por ADVP", y_max=y_max_advp)
 
     # 3) Preço Top 20 trechos
-    if menor_preco:
-        by_trecho = (df_emp.groupby("TRECHO", as_index=False)["TOTAL"].min()
-                          .rename(columns={"TOTAL":"PRECO"})
-                          .sort_values("PRECO", ascending=False).head(20))
-    else:
-        by_trecho = (df_emp.groupby("TRECHO", as_index=False)["TOTAL"].mean()
-                          .rename(columns={"TOTAL":"PRECO"})
-                          .sort_values("PRECO", ascending=False).head(20))
+    by_trecho = (_reagrega(aggs_emp, "TRECHO", menor_preco)
+                      .sort_values("PRECO", ascending=False).head(20))
     y_max_trecho = dynamic_limit(by_trecho["PRECO"], hard_cap)
     barras_com_tendencia(by_trecho, "TRECHO", "PRECO", "N",
                          "Preço Top 20 trechos", y_max=y_max_trecho)
 
     # 4) Tabela Top 3
-    top3_tabela(df_emp, agg="min" if menor_preco else "mean")
+    top3_tabela(aggs_emp, agg="min" if menor_preco else "mean")
 
     # 5) SHARE CIAS
     chart_cia_stack_trecho(df_emp)
@@ -530,12 +613,21 @@ def render_empresa(df_emp: pd.DataFrame, key_suffix: str):
 # ==========================
 # Abas
 # ==========================
+@st.cache_data(show_spinner=False, max_entries=32)
+def linhas_empresas(_view: pd.DataFrame, filtro_sig: tuple) -> dict:
+    # 1 partição da visão filtrada (códigos da categoria EMPRESA) em vez de 1 varredura + cópia por aba;
+    # cacheia só as posições de cada empresa (arrays de ints), não os frames
+    return dict(_view.groupby("EMPRESA", sort=False, observed=True).indices)
+
+por_empresa = {emp: view_all.iloc[ix] for emp, ix in linhas_empresas(view_all, filtro_sig).items()}
+aggs = precompute_aggs(view_all, filtro_sig)
+vazio = view_all.iloc[:0]
 abas = st.tabs(["FLIPMILHAS","CAPO VIAGENS","MAXMILHAS","123MILHAS"])
 with abas[0]:
-    render_empresa(view_all[view_all["EMPRESA"] == "FLIPMILHAS"].copy(), "FLIPMILHAS")
+    render_empresa(por_empresa.get("FLIPMILHAS", vazio), aggs.get("FLIPMILHAS"), "FLIPMILHAS")
 with abas[1]:
-    render_empresa(view_all[view_all["EMPRESA"] == "CAPO VIAGENS"].copy(), "CAPO")
+    render_empresa(por_empresa.get("CAPO VIAGENS", vazio), aggs.get("CAPO VIAGENS"), "CAPO")
 with abas[2]:
-    render_empresa(view_all[view_all["EMPRESA"] == "MAXMILHAS"].copy(), "MAX")
+    render_empresa(por_empresa.get("MAXMILHAS", vazio), aggs.get("MAXMILHAS"), "MAX")
 with abas[3]:
-    render_empresa(view_all[view_all["EMPRESA"] == "123MILHAS"].copy(), "123")
+    render_empresa(por_empresa.get("123MILHAS", vazio), aggs.get("123MILHAS"), "123")